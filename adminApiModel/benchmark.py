@@ -0,0 +1,173 @@
+import datetime, json, statistics, subprocess, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from knox.models import AuthToken
+
+from adminApiModel.populate_db import populate
+from finance.models import Sales, Expenses, Bank_Status
+from jobs import renderers
+from location.models import Branches
+from staff import payroll
+from staff.models import Hours_In, Bimonthly_In
+from stock.models import Products, Purchases, Transactions
+
+
+# run_benchmarks fills a throwaway database with populate_db.populate() and
+# times the pages and reports the managers wait on. Every run is rolled
+# back, so each one starts from the same data. The results are written as
+# JSON next to the commit they were measured on, to compare commits.
+
+
+CHANGELISTS = [
+    ('sales', '/finance/sales/'),
+    ('expenses', '/finance/expenses/'),
+    ('purchases', '/stock/purchases/'),
+    ('bank status', '/finance/bank_status/'),
+    ('hours in', '/staff/hours_in/'),
+    ('bimonthly in', '/staff/bimonthly_in/'),
+    ('roles', '/staff/roles/'),
+    ('transactions', '/stock/transactions/'),
+]
+
+
+def measure(fn, repeat, setup=None):
+    """
+    Run ``fn`` ``repeat`` times, each in a transaction that is rolled back
+    after, and return its fastest, median and slowest time in ms with the
+    queries of its last run. ``setup`` runs in the same transaction
+    without being timed.
+    """
+    durations = []
+    for _ in range(repeat):
+        with transaction.atomic():
+            if setup:
+                setup()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                result = fn()
+                durations.append((time.perf_counter() - started) * 1000)
+            transaction.set_rollback(True)
+    measured = {
+        'min_ms': round(min(durations), 2),
+        'median_ms': round(statistics.median(durations), 2),
+        'max_ms': round(max(durations), 2),
+        'queries': len(queries),
+    }
+    status = getattr(result, 'status_code', None)
+    if status is not None:
+        measured['status'] = status
+    return measured
+
+
+def payroll_period(manager):
+    """
+    Bimonthly_In of the latest period whose next period run_cycle still
+    accepts.
+    """
+    limit = timezone.localdate() + datetime.timedelta(days=10)
+    for date in Bimonthly_In.objects.filter(manager=manager).order_by('-date').values_list('date', flat=True).distinct():
+        bimonthlies = list(Bimonthly_In.objects.filter(manager=manager, date=date))
+        if payroll.next_period(bimonthlies[0])[0] <= limit:
+            return bimonthlies
+    return []
+
+
+def run(repeat=3):
+    """ Time every benchmark against the first manager populate() made """
+    manager = Branches.objects.order_by('id').first().manager
+    # a failing page is reported with its status instead of stopping the run
+    client = Client(raise_request_exception=False)
+    client.force_login(manager)
+    results = {}
+
+    for name, url in CHANGELISTS:
+        results['changelist ' + name] = measure(lambda: client.get(url), repeat)
+
+    end = timezone.localdate()
+    results['weekly report'] = measure(
+        lambda: renderers.weekly(manager.id, str(end - datetime.timedelta(days=6)), str(end)), repeat)
+    results['monthly report'] = measure(
+        lambda: renderers.monthly(manager.id, str(end.replace(day=1))), repeat)
+    ids = list(Bimonthly_In.objects.filter(manager=manager).order_by('-date').values_list('id', flat=True)[:50])
+    results['payslip export'] = measure(lambda: renderers.payslips(manager.id, ids), repeat)
+
+    # the next period of every staff, as automate_entries creates it, and
+    # a single record saved as the admin form does
+    bimonthlies = payroll_period(manager)
+    if bimonthlies:
+        after = bimonthlies[0].date
+        next_date, day, pay_gov = payroll.next_period(bimonthlies[0])
+        clear = lambda: Bimonthly_In.objects.filter(manager=manager, date__gt=after).delete()
+        results['payroll cycle'] = measure(lambda: payroll.run_cycle(bimonthlies), repeat, setup=clear)
+
+        def save():
+            obj = Bimonthly_In(staff_id=bimonthlies[0].staff_id, manager=manager, date=next_date, day=day,
+                               pay_sss=pay_gov, pay_ph=pay_gov, pay_pi=pay_gov)
+            payroll.compute_bimonthly(obj, pay_loans=True)
+            obj.save()
+        results['payroll save'] = measure(save, repeat, setup=clear)
+
+    retailer = Transactions.objects.filter(manager=manager).order_by('id').first().retailer
+    _, token = AuthToken.objects.create(retailer)
+    product = Products.objects.filter(manager=manager).order_by('id').first()
+    auth = {'HTTP_AUTHORIZATION': 'Token ' + token}
+    pos = Client(raise_request_exception=False)
+    results['pos list'] = measure(lambda: pos.get('/pos/api/', **auth), repeat)
+    results['pos create'] = measure(
+        lambda: pos.post('/pos/api/', {'retailer': retailer.id, 'product': product.id, 'count': 1}, **auth),
+        repeat)
+    basket = {'key': 'benchmark', 'lines': [{'product': product.id, 'count': 1}] * 20}
+    results['pos batch'] = measure(
+        lambda: pos.post('/pos/api/batch/', basket, content_type='application/json', **auth), repeat)
+    results['pos catalog'] = measure(lambda: pos.get('/pos/catalog/', **auth), repeat)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(size=1, days=365, repeat=3):
+    """
+    Populate a new test database with ``size`` managers over ``days`` days,
+    time every benchmark and drop the database again. Returns the results
+    with the commit and the size of the data they were measured on.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        cache.clear()
+        started = time.perf_counter()
+        populate(size=size, days=days)
+        populate_s = time.perf_counter() - started
+        cache.clear()
+        return {
+            'commit': git_commit(),
+            'time': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'size': size,
+            'days': days,
+            'repeat': repeat,
+            'populate_s': round(populate_s, 2),
+            'counts': {model.__name__: model.objects.count()
+                       for model in [Sales, Expenses, Purchases, Bank_Status, Hours_In, Bimonthly_In, Transactions]},
+            'results': run(repeat),
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def save(results, path):
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2)
@@ -0,0 +1,162 @@
+import glob, heapq, itertools, json, logging, math, time
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# slowest statements kept per request
+SLOWEST_QUERIES = 5
+
+# longest part of a statement written to the log
+MAX_SQL_LENGTH = 500
+
+
+# InstrumentationMiddleware times every request and writes one JSON line per
+# request to the rotating log set up in settings.LOGGING. dashboard() reads
+# the log back and shows the spread of each view's timings.
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting and timing the statements of a
+    request, keeping the slowest ones.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.slowest = []
+        self.order = itertools.count()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            entry = (duration, next(self.order), sql[:MAX_SQL_LENGTH])
+            if len(self.slowest) < SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+
+def view_tag(request):
+    """
+    Name of the view that served ``request``: the model and admin view for
+    admin pages, such as "finance.sales changelist" or "finance.expenses
+    action expense_monthly_report", otherwise the url name.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    model_admin = getattr(match.func, 'model_admin', None)
+    # the admin's redirect from <object id>/ to the change page has no name
+    if model_admin is None or match.url_name is None:
+        return match.view_name or match._func_path
+
+    opts = model_admin.model._meta
+    view = match.url_name[len(opts.app_label + '_' + opts.model_name + '_'):]
+    if view == 'changelist' and request.method == 'POST' and request.POST.get('action'):
+        view = 'action ' + request.POST['action']
+    return opts.label_lower + ' ' + view
+
+
+def record(request, response, queries, duration):
+    """ Log one request. Never raises, the response goes out regardless """
+    try:
+        write_record(request, response, queries, duration)
+    except Exception:
+        logger.exception("Could not record " + request.path)
+
+
+def write_record(request, response, queries, duration):
+    if response.streaming:
+        size = None
+    else:
+        size = len(response.content)
+    logger.info(json.dumps({
+        'time': timezone.now().isoformat(),
+        'view': view_tag(request),
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'queries': queries.count,
+        'sql_ms': round(queries.duration * 1000, 2),
+        'python_ms': round((duration - queries.duration) * 1000, 2),
+        'total_ms': round(duration * 1000, 2),
+        'size': size,
+        'slowest': [{'ms': round(d * 1000, 2), 'sql': sql}
+                    for d, _, sql in sorted(queries.slowest, reverse=True)],
+    }))
+
+
+def load_records(path):
+    records = []
+    # the current log and the ones RotatingFileHandler moved aside
+    for name in glob.glob(path) + glob.glob(path + '.*'):
+        with open(name) as log:
+            for line in log:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def summarize(records):
+    """
+    One row per view with the median and 95th percentile of its timings
+    and query counts, slowest views first.
+    """
+    views = {}
+    for r in records:
+        views.setdefault(r['view'], []).append(r)
+
+    rows = []
+    for view, requests in views.items():
+        total = [r['total_ms'] for r in requests]
+        sql = [r['sql_ms'] for r in requests]
+        queries = [r['queries'] for r in requests]
+        sizes = [r['size'] for r in requests if r['size'] is not None]
+        slowest = max(requests, key=lambda r: r['total_ms'])
+        rows.append({
+            'view': view,
+            'requests': len(requests),
+            'total_p50': percentile(total, 50),
+            'total_p95': percentile(total, 95),
+            'sql_p50': percentile(sql, 50),
+            'sql_p95': percentile(sql, 95),
+            'queries_p50': percentile(queries, 50),
+            'queries_p95': percentile(queries, 95),
+            'size_p95': percentile(sizes, 95),
+            'slowest': slowest['slowest'],
+        })
+    rows.sort(key=lambda row: row['total_p95'], reverse=True)
+    return rows
+
+
+def dashboard(request):
+    if not request.user.is_superuser:
+        raise PermissionDenied
+    context = dict(
+        admin.site.each_context(request),
+        title='Request Timings',
+        enabled=settings.INSTRUMENTATION,
+        rows=summarize(load_records(settings.INSTRUMENTATION_LOG)),
+    )
+    return TemplateResponse(request, 'admin/instrumentation.html', context)
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import instrumentation
+from .scope import AccessScope
+
+
+class AccessScopeMiddleware:
+    """
+    Attach the AccessScope of the logged in user to every request as
+    ``request.scope``. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.scope = AccessScope(request.user)
+        return self.get_response(request)
+
+
+class InstrumentationMiddleware:
+    """
+    Log the query count, SQL time, slowest statements, Python time and
+    response size of every request when settings.INSTRUMENTATION is on.
+    Goes first in MIDDLEWARE so the other middleware is timed too.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = instrumentation.QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        instrumentation.record(request, response, queries, time.perf_counter() - started)
+        return response
@@ -2,10 +2,16 @@ import random
 import datetime
 
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
 from django.utils import timezone
 
-from finance.models import Sales
-from location.models import Branches
+from finance import ledger, summary
+from finance.models import Sales, Expenses, Expense_Types, Expense_Methods, Banks, Bank_Status
+from location.models import Branches, Current_Branch
+from staff import payroll
+from staff.models import Roles, Companies, Hours_In, Bimonthly_In, Government_Benefits, Loans
+from stock.models import Purchases, Purchase_Payment_Method, Distributor, Products, Transactions
 
 def add_sales(count=10, manager='manager1', date=datetime.datetime(year=2020, month=3, day=27).date()):
     manager = get_user_model().objects.get(username=manager)
@@ -37,4 +43,259 @@ def add_sales(count=10, manager='manager1', date=datetime.datetime(year=2020, mo
             cash_for_deposit=cash_for_deposit,
         ).save()
 
-        date = date - datetime.timedelta(days=1)
\ No newline at end of file
+        date = date - datetime.timedelta(days=1)
+
+# Synthetic dataset for benchmarks and local testing. populate() creates
+# ``size`` managers, each running BRANCHES branches over ``days`` days,
+# with everything written in bulk. bulk_create skips save() and the
+# signals, so computed columns are filled in here and the bank ledgers
+# and daily branch summaries are rebuilt at the end.
+
+BRANCHES = 4
+STAFF_PER_BRANCH = 3
+EXPENSE_TYPES = ['Rent', 'Electricity', 'Water', 'Internet', 'Supplies', 'Repairs', 'Transport', 'Meals']
+EXPENSE_METHODS = ['Cash', 'Check', 'Bank Transfer']
+BANKS = ['BDO', 'BPI', 'Metrobank']
+PURCHASE_PAYMENT_METHODS = ['Cash', 'Check', 'Terms']
+DISTRIBUTORS = ['Zuellig', 'Metro Drug', 'DKSH', 'United Lab']
+PRODUCTS = 40
+TRANSACTIONS_PER_DAY = 10
+# SQLite inserts a batch as one compound SELECT, at most 500 terms
+BATCH_SIZE = 500
+
+# (month, day) of the regular holidays
+HOLIDAYS = [(1, 1), (4, 9), (5, 1), (6, 12), (8, 30), (11, 30), (12, 25), (12, 30)]
+
+
+def populate(size=1, days=365, end=None, seed=0):
+    """
+    Create ``size`` managers with their branches, staff, a year of sales,
+    expenses, purchases, bank statuses, working hours, payroll and POS
+    transactions up to ``end``, today by default. Returns the managers.
+    """
+    rand = random.Random(seed)
+    end = end or timezone.localdate()
+    start = end - datetime.timedelta(days=days - 1)
+    dates = [start + datetime.timedelta(days=d) for d in range(days)]
+
+    # hashing is slow on purpose, so every user shares the one password
+    password = make_password('password')
+    group, _ = Group.objects.get_or_create(name='Managers')
+    group.permissions.set(Permission.objects.all())
+
+    first = get_user_model().objects.filter(username__regex=r'^manager[0-9]+$').count() + 1
+    managers = [add_manager(rand, 'manager' + str(first + m), password, group, dates) for m in range(size)]
+
+    for bank in Banks.objects.filter(manager__in=managers):
+        ledger.rebuild(bank.id)
+    summary.rebuild(start, end)
+    return managers
+
+
+def bulk(model, objs, **lookup):
+    # bulk_create only sets primary keys on PostgreSQL, so read the
+    # records back
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    return list(model.objects.filter(**lookup).order_by('id'))
+
+
+def add_manager(rand, username, password, group, dates):
+    manager = get_user_model().objects.create(username=username, password=password, is_staff=True,
+                                              first_name='Manager', last_name=username[len('manager'):])
+    manager.groups.add(group)
+    Roles.objects.create(user=manager, manager=manager, is_manager=True)
+    company = Companies.objects.create(manager=manager, name='Pharmacy ' + manager.last_name)
+
+    branches = bulk(Branches, [Branches(manager=manager, location='Branch ' + str(b + 1))
+                               for b in range(BRANCHES)], manager=manager)
+    staff_branches = add_staff(rand, manager, company, branches, password, group)
+
+    expense_types = bulk(Expense_Types, [Expense_Types(manager=manager, name=n) for n in EXPENSE_TYPES],
+                         manager=manager)
+    expense_methods = bulk(Expense_Methods, [Expense_Methods(manager=manager, name=n) for n in EXPENSE_METHODS],
+                           manager=manager)
+    banks = bulk(Banks, [Banks(manager=manager, name=n) for n in BANKS], manager=manager)
+    payment_methods = bulk(Purchase_Payment_Method, [Purchase_Payment_Method(manager=manager, name=n)
+                                                     for n in PURCHASE_PAYMENT_METHODS], manager=manager)
+    distributors = bulk(Distributor, [Distributor(manager=manager, name=n) for n in DISTRIBUTORS],
+                        manager=manager)
+    products = bulk(Products, [Products(manager=manager, name='Product ' + str(p + 1), size=rand.choice(['10mg', '50ml', '100ml', '1pc']),
+                                        price=rand.randint(5, 500), cost=0, date_start=dates[0],
+                                        product_id='P' + str(manager.id) + '-' + str(p + 1),
+                                        items_per_package=rand.choice([1, 10, 100]))
+                               for p in range(PRODUCTS)], manager=manager)
+
+    add_sales_and_deposits(rand, manager, branches, banks, dates)
+    add_expenses_and_withdrawals(rand, manager, branches, expense_types, expense_methods, banks, dates)
+    add_purchases(rand, manager, branches, payment_methods, distributors, dates)
+    add_transactions(rand, manager, branches, products, staff_branches, dates)
+    hours = add_hours_in(rand, manager, staff_branches, dates)
+    add_payroll(manager, staff_branches, hours, dates)
+    return manager
+
+
+def add_staff(rand, manager, company, branches, password, group):
+    """ Create the staff of every branch. Returns {staff: branch}. """
+    prefix = manager.username + '-staff-'
+    count = len(branches) * STAFF_PER_BRANCH
+    staff = bulk(get_user_model(), [get_user_model()(username=prefix + str(s + 1), password=password, is_staff=True,
+                                                     first_name='Staff', last_name=str(s + 1))
+                                    for s in range(count)], username__startswith=prefix)
+    get_user_model().groups.through.objects.bulk_create([
+        get_user_model().groups.through(user_id=s.id, group_id=group.id) for s in staff
+    ])
+
+    staff_branches = {s: branches[i // STAFF_PER_BRANCH] for i, s in enumerate(staff)}
+    # the first staff assists the manager in every branch
+    assistant = staff[0]
+    roles = bulk(Roles, [Roles(user=s, manager=manager, company=company, staff_id=i + 1,
+                               hrly_rate=rand.choice([50, 55, 60, 70]), hrly_allow=rand.choice([0, 5, 10]),
+                               days=7, is_retailer=s != assistant, is_assistant=s == assistant,
+                               sale_days=60, expense_days=60, purchase_days=60, hours_in_days=60,
+                               sale_can_validate=True, expense_can_validate=True, purchase_can_validate=True)
+                         for i, s in enumerate(staff)], user__in=staff)
+
+    role_branches = []
+    for r in roles:
+        if r.user_id == assistant.id:
+            role_branches += [(r, b) for b in branches]
+        else:
+            role_branches.append((r, staff_branches[r.user]))
+    for field in ['branches', 'sale_branches', 'expense_branches', 'purchase_branches', 'hours_in_branches']:
+        through = getattr(Roles, field).through
+        through.objects.bulk_create([through(roles_id=r.id, branches_id=b.id) for r, b in role_branches
+                                     if field == 'branches' or r.user_id == assistant.id])
+
+    Current_Branch.objects.bulk_create([Current_Branch(manager=manager, user=s, branch=b)
+                                        for s, b in staff_branches.items()])
+    benefits = bulk(Government_Benefits, [Government_Benefits(staff=s, manager=manager, institute=institute,
+                                                              total=0, staff_cont=cont, mngr_cont=cont * 2)
+                                          for s in staff
+                                          for institute, cont in [('SSS', 580), ('PH', 175), ('PI', 100)]],
+                    manager=manager)
+    Loans.objects.bulk_create([Loans(manager=manager, institute=gb, loan_type='SAL',
+                                     date_str=timezone.localdate(), date_end=timezone.localdate() + datetime.timedelta(days=730),
+                                     total=10000, mnth_pay=500, total_paid=0, interest=0)
+                               for gb in benefits if gb.institute == 'SSS' and rand.random() < 0.3])
+    return staff_branches
+
+
+def bank_status_date(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time(18)))
+
+
+def add_sales_and_deposits(rand, manager, branches, banks, dates):
+    sales = []
+    for date in dates:
+        for branch in branches:
+            cash_on_caja = rand.randint(10000, 20000)
+            gross_sales = cash_on_caja + rand.randint(-100, 100)
+            cash_for_deposit = cash_on_caja - rand.choice([0, 0, 500, 1000])
+            sales.append(Sales(manager=manager, branch=branch, date=date, gross_sales=gross_sales,
+                               cash_on_caja=cash_on_caja, cash_for_deposit=cash_for_deposit,
+                               short_or_over=cash_on_caja - gross_sales,
+                               caja_minus_deposit=cash_on_caja - cash_for_deposit,
+                               bank=rand.choice(banks), was_deposited=True,
+                               num_trxn=rand.randint(50, 300), num_cstmr=rand.randint(40, 250)))
+    sales = bulk(Sales, sales, manager=manager)
+    Bank_Status.objects.bulk_create([
+        Bank_Status(manager=manager, bank_id=s.bank_id, date=bank_status_date(s.date),
+                    sale_report=s, deposit=s.cash_for_deposit)
+        for s in sales
+    ], batch_size=BATCH_SIZE)
+
+
+def add_expenses_and_withdrawals(rand, manager, branches, expense_types, expense_methods, banks, dates):
+    expenses = []
+    for date in dates:
+        for branch in branches:
+            for expense_type in expense_types:
+                if rand.random() < 0.3:
+                    expenses.append(Expenses(manager=manager, branch=branch, type_of_expense=expense_type,
+                                             method_of_payment=rand.choice(expense_methods), date=date,
+                                             amount=rand.randint(100, 5000), is_paid=True,
+                                             bank=rand.choice(banks) if rand.random() < 0.2 else None))
+    expenses = bulk(Expenses, expenses, manager=manager)
+    Bank_Status.objects.bulk_create([
+        Bank_Status(manager=manager, bank_id=e.bank_id, date=bank_status_date(e.date),
+                    expense_report=e, withdraw=e.amount)
+        for e in expenses if e.bank_id
+    ], batch_size=BATCH_SIZE)
+
+
+def add_purchases(rand, manager, branches, payment_methods, distributors, dates):
+    purchases = []
+    for date in dates:
+        for branch in branches:
+            if rand.random() < 0.4:
+                invoice_worth = rand.randint(2000, 30000)
+                delivered_worth = invoice_worth - rand.choice([0, 0, 0, 150])
+                purchases.append(Purchases(manager=manager, branch=branch, date=date, is_paid=rand.random() < 0.8,
+                                           payment_method=rand.choice(payment_methods), distributor=rand.choice(distributors),
+                                           invoice_worth=invoice_worth, delivered_worth=delivered_worth,
+                                           short_or_over=invoice_worth - delivered_worth or None,
+                                           invoice_range=str(rand.randint(1000, 9999))))
+    Purchases.objects.bulk_create(purchases, batch_size=BATCH_SIZE)
+
+
+def add_transactions(rand, manager, branches, products, staff_branches, dates):
+    retailers = {}
+    for staff, branch in staff_branches.items():
+        retailers.setdefault(branch.id, []).append(staff)
+    transactions = []
+    for date in dates:
+        for branch in branches:
+            for t in range(TRANSACTIONS_PER_DAY):
+                transactions.append(Transactions(manager=manager, retailer=rand.choice(retailers[branch.id]),
+                                                 branch=branch, product=rand.choice(products),
+                                                 count=rand.randint(1, 5), date=date,
+                                                 time=datetime.time(8 + t * 12 // TRANSACTIONS_PER_DAY, rand.randint(0, 59))))
+    Transactions.objects.bulk_create(transactions, batch_size=BATCH_SIZE)
+
+
+def add_hours_in(rand, manager, staff_branches, dates):
+    """ Create the daily hours of every staff. Returns {staff id: [Hours_In]}. """
+    hours = {}
+    for staff in staff_branches:
+        for date in dates:
+            if date.weekday() == 6:
+                continue
+            if (date.month, date.day) in HOLIDAYS:
+                day_type = 'HD'
+            else:
+                day_type = rand.choices(['REG', 'SL', 'VL'], weights=[96, 2, 2])[0]
+            h = 8 if day_type == 'REG' else rand.choice([0, 8]) if day_type == 'HD' else 0
+            overtime = rand.choice([0, 0, 0, 1, 2]) if h == 8 else 0
+            hours.setdefault(staff.id, []).append(Hours_In(staff=staff, manager=manager, date=date, hours=h,
+                                                           overtime_hours=overtime, day_type=day_type))
+    Hours_In.objects.bulk_create([h for staff_hours in hours.values() for h in staff_hours], batch_size=BATCH_SIZE)
+    return hours
+
+
+def add_payroll(manager, staff_branches, hours, dates):
+    roles = {r.user_id: r for r in Roles.objects.filter(manager=manager).filter(is_manager=False)}
+    payroll_dates = [d for d in dates if d.day in (8, 23)]
+    entries = []
+    for date in payroll_dates:
+        day = str(date.day)
+        low_limit, up_limit = Hours_In.get_period(day, date)
+        if low_limit < dates[0]:
+            continue
+        staff = list(staff_branches)
+        staff_hours = []
+        for s in staff:
+            totals = payroll.empty_hours()
+            for h in hours.get(s.id, []):
+                if low_limit <= h.date <= up_limit:
+                    totals[h.day_type]['hours'] += h.hours
+                    totals[h.day_type]['overtime'] += h.overtime_hours
+                    totals[h.day_type]['days'] += 1
+                    totals[h.day_type]['zero_days'] += h.hours == 0
+            staff_hours.append(totals)
+        pays = payroll.compute_pays(staff_hours,
+                                    [roles[s.id].hrly_rate for s in staff],
+                                    [roles[s.id].hrly_allow for s in staff],
+                                    [[] for s in staff], [[] for s in staff])
+        for s, pay in zip(staff, pays):
+            entries.append(Bimonthly_In(staff=s, manager=manager, date=date, day=day, **pay))
+    Bimonthly_In.objects.bulk_create(entries, batch_size=BATCH_SIZE)
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.db import models
+from django.utils import timezone
+
+from .scope import AccessScope
+
+
+class ScopedQuerySet(models.QuerySet):
+    """
+    Queryset of records kept per manager, branch and date, such as sales,
+    expenses, purchases and transactions.
+    """
+
+    def for_user(self, user, module=None, days=None):
+        """
+        The records ``user`` may see. Managers see all of their records.
+        Assistants see the branches and day window their roles give them
+        for ``module`` (sale, expense or purchase). Retailers, and
+        assistants when no module is given, see their own branches over
+        ``days`` or their own day window, one day when neither is set.
+        """
+        scope = AccessScope.of(user)
+        if scope.is_superuser:
+            return self.all()
+        elif scope.is_manager:
+            return self.filter(manager_id=scope.manager_id)
+        elif scope.is_assistant and module:
+            days = scope.days(module)
+            branch_ids = scope.module_branch_ids(module)
+            if not (days and branch_ids):
+                raise RuntimeError("User is assistant but roles improperly configured")
+        elif scope.is_retailer or scope.is_assistant:
+            days = days or scope.days() or 1
+            branch_ids = scope.branch_ids
+        else:
+            return self.none()
+
+        # the branch ids and the first day are passed as plain values so
+        # the whole predicate can be answered by the (manager, branch,
+        # date) index
+        return self.filter(manager_id=scope.manager_id,
+                           branch_id__in=branch_ids,
+                           date__gte=timezone.localdate() - timedelta(days=days))
+
+
+ScopedManager = models.Manager.from_queryset(ScopedQuerySet)
@@ -0,0 +1,142 @@
+from django.contrib.auth import get_user_model
+from django.db.models import prefetch_related_objects
+from django.utils.functional import cached_property
+
+from location.models import Branches
+from staff.models import Roles
+
+
+class AccessScope:
+    """
+    What the user of a request is allowed to see: the manager whose records
+    they work on, their branches and the day windows of each module.
+
+    AccessScopeMiddleware builds one per request, loading the user's roles
+    with a single query. Branch lists are read the first time they are
+    needed and kept for the rest of the request.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        user._access_scope = self
+        self.is_superuser = user.is_superuser
+        self.roles = None
+        if user.is_authenticated:
+            self.roles = Roles.objects.select_related('manager').filter(user_id=user.id).first()
+        if self.roles is not None:
+            # later request.user.roles lookups reuse this instance and its
+            # prefetched branches instead of querying again
+            user.roles = self.roles
+        self.is_manager = bool(self.roles and self.roles.is_manager)
+        self.is_assistant = bool(self.roles and self.roles.is_assistant)
+        self.is_retailer = bool(self.roles and self.roles.is_retailer)
+        self._module_branch_ids = {}
+
+    @classmethod
+    def of(cls, user):
+        """The scope already built for ``user``, or a new one."""
+        scope = getattr(user, '_access_scope', None)
+        if scope is None:
+            scope = cls(user)
+        return scope
+
+    @cached_property
+    def manager_id(self):
+        if self.is_manager:
+            return self.user.id
+        if self.roles is None:
+            return None
+        return self.roles.manager_id
+
+    @cached_property
+    def manager(self):
+        if self.is_manager:
+            return self.user
+        if self.roles is None:
+            return None
+        return self.roles.manager
+
+    @cached_property
+    def branch_ids(self):
+        """Ids of the branches the user is assigned to."""
+        if self.roles is None:
+            return []
+        prefetch_related_objects([self.roles], 'branches')
+        return [b.id for b in self.roles.branches.all()]
+
+    def module_branch_ids(self, module):
+        """
+        Ids of the branches an assistant works on in ``module``, one of
+        sale, expense, purchase or hours_in.
+        """
+        if module not in self._module_branch_ids:
+            if self.roles is None:
+                self._module_branch_ids[module] = []
+            else:
+                prefetch_related_objects([self.roles], module + '_branches')
+                branches = getattr(self.roles, module + '_branches').all()
+                self._module_branch_ids[module] = [b.id for b in branches]
+        return self._module_branch_ids[module]
+
+    def days(self, module=None):
+        """
+        How many days back the user sees in ``module``, or their own day
+        window when no module is given.
+        """
+        if self.roles is None:
+            return None
+        if module is None:
+            return self.roles.days
+        return getattr(self.roles, module + '_days')
+
+    def owned(self, model):
+        """Records of ``model`` belonging to the user's manager."""
+        if self.is_superuser:
+            return model.objects.all()
+        return model.objects.filter(manager_id=self.manager_id)
+
+    def active(self, model):
+        """Active records of ``model`` belonging to the user's manager."""
+        if self.is_superuser:
+            return model.objects.all()
+        return self.owned(model).filter(is_active=True)
+
+    def manager_branches(self):
+        return self.owned(Branches)
+
+    def open_branches(self):
+        """Open branches the user may pick for a record."""
+        if self.is_superuser:
+            return Branches.objects.all()
+        elif self.is_manager:
+            return Branches.objects.filter(manager_id=self.user.id).filter(is_open=True)
+        return Branches.objects.filter(id__in=self.branch_ids).filter(is_open=True)
+
+    def assignable_branches(self):
+        """Open branches the user may assign staff to."""
+        if self.is_assistant and not self.is_superuser:
+            return self.owned(Branches).filter(is_open=True)
+        return self.open_branches()
+
+    def staff_users(self):
+        """Users working for the user's manager."""
+        if self.is_superuser:
+            return get_user_model().objects.all()
+        return get_user_model().objects.filter(roles__manager_id=self.manager_id)
+
+    def branch_staff_users(self):
+        """Users working for the user's manager in the user's branches."""
+        if self.is_superuser or self.is_manager:
+            return self.staff_users()
+        return self.staff_users().filter(roles__branches__in=self.branch_ids).distinct()
+
+
+def get_scope(request):
+    """
+    The AccessScope of ``request``, built here when AccessScopeMiddleware
+    did not run, as in admin actions called directly.
+    """
+    scope = getattr(request, 'scope', None)
+    if scope is None:
+        scope = request.scope = AccessScope.of(request.user)
+    return scope
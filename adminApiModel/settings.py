@@ -54,12 +54,16 @@ INSTALLED_APPS = [
     'location',
     'finance',
     'stock',
+    'jobs',
 ]
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('knox.auth.TokenAuthentication',)
+    'DEFAULT_AUTHENTICATION_CLASSES': ('staff.authentication.CachedTokenAuthentication',)
 }
 
+# seconds a verified POS token is remembered by each server process
+AUTH_TOKEN_CACHE_TTL = 30
+
 REST_KNOX = {
     'TOKEN_TTL': timedelta(hours=8),
     'AUTO_REFRESH': False,
@@ -67,11 +71,13 @@ REST_KNOX = {
 }
 
 MIDDLEWARE = [
+    'adminApiModel.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'adminApiModel.middleware.AccessScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -114,6 +120,18 @@ DATABASES = {
     }
 }
 
+# Cached totals, bank balances and product catalogs are invalidated on
+# save, which only works when every apache process shares the cache, so it
+# is kept in the database. Create the table with
+# python3 manage.py createcachetable
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -164,4 +182,33 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 PRIVATE_STORAGE_ROOT = os.path.join(BASE_DIR, 'private-media')
 PRIVATE_STORAGE_AUTH_FUNCTION = 'private_storage.permissions.allow_staff'
 
-IMPORT_EXPORT_USE_TRANSACTIONS = True
\ No newline at end of file
+IMPORT_EXPORT_USE_TRANSACTIONS = True
+
+
+# Request timings of every page, written to a rotating log and shown to
+# superusers at /instrumentation/. Off unless INSTRUMENTATION=1 is set in
+# the environment
+
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION') == '1'
+INSTRUMENTATION_LOG = os.path.join(BASE_DIR, 'instrumentation.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'instrumentation': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': INSTRUMENTATION_LOG,
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'adminApiModel.instrumentation': {
+            'handlers': ['instrumentation'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
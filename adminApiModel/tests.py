@@ -0,0 +1,176 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.test import RequestFactory, TestCase
+from django.urls import resolve
+
+from adminApiModel import instrumentation
+from adminApiModel.scope import AccessScope, get_scope
+from location.models import Branches, Current_Branch
+from staff.models import Roles
+
+
+class ViewTagTest(TestCase):
+
+    def tag(self, method, path, data=None):
+        request = getattr(RequestFactory(), method)(path, data or {})
+        request.resolver_match = resolve(path)
+        return instrumentation.view_tag(request)
+
+    def test_changelist(self):
+        self.assertEqual(self.tag('get', '/finance/sales/'), 'finance.sales changelist')
+
+    def test_change(self):
+        self.assertEqual(self.tag('get', '/finance/sales/1/change/'), 'finance.sales change')
+
+    def test_action(self):
+        self.assertEqual(self.tag('post', '/finance/expenses/', {'action': 'expense_monthly_report'}),
+                         'finance.expenses action expense_monthly_report')
+
+    def test_object_redirect(self):
+        # the admin's unnamed <object id>/ url
+        self.assertTrue(self.tag('get', '/finance/sales/1/'))
+
+    def test_other_view(self):
+        self.assertEqual(self.tag('get', '/instrumentation/'), 'instrumentation')
+
+
+class SummaryTest(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(instrumentation.percentile(values, 50), 50)
+        self.assertEqual(instrumentation.percentile(values, 95), 95)
+        self.assertEqual(instrumentation.percentile([7], 95), 7)
+        self.assertIsNone(instrumentation.percentile([], 50))
+
+    def test_summarize(self):
+        def record(view, total_ms, size):
+            return {'view': view, 'total_ms': total_ms, 'sql_ms': total_ms / 2, 'queries': 3, 'size': size,
+                    'slowest': [{'ms': total_ms / 2, 'sql': view}]}
+        rows = instrumentation.summarize([record('fast', 10, 100), record('slow', 200, None),
+                                          record('slow', 100, 50), record('fast', 20, 300)])
+        self.assertEqual([r['view'] for r in rows], ['slow', 'fast'])
+        self.assertEqual((rows[0]['requests'], rows[0]['total_p50'], rows[0]['total_p95']), (2, 100, 200))
+        self.assertEqual(rows[0]['size_p95'], 50)
+        self.assertEqual(rows[0]['slowest'], [{'ms': 100, 'sql': 'slow'}])
+
+
+class DashboardTest(TestCase):
+
+    def test_superusers_only(self):
+        staff = get_user_model().objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/instrumentation/').status_code, 403)
+
+        superuser = get_user_model().objects.create_superuser(username='admin', password='admin')
+        self.client.force_login(superuser)
+        self.assertEqual(self.client.get('/instrumentation/').status_code, 200)
+
+
+class RecordTest(TestCase):
+
+    def test_failed_record_does_not_break_response(self):
+        request = RequestFactory().get('/nowhere/')
+        with self.assertLogs('adminApiModel.instrumentation', 'ERROR'):
+            instrumentation.record(request, None, instrumentation.QueryRecorder(), 0.1)
+
+
+class AccessScopeTest(TestCase):
+
+    def setUp(self):
+        self.manager = self.add_user('manager', is_manager=True)
+        self.alpha = Branches.objects.create(manager=self.manager, location='Alpha')
+        self.bravo = Branches.objects.create(manager=self.manager, location='Bravo')
+        Branches.objects.create(manager=self.manager, location='Closed', is_open=False)
+        self.assistant = self.add_user('assistant', is_assistant=True, days=7, sale_days=3)
+        self.assistant.roles.sale_branches.add(self.bravo)
+        self.retailer = self.add_user('retailer', is_retailer=True, days=1)
+        other = self.add_user('other', is_manager=True)
+        Branches.objects.create(manager=other, location='Elsewhere')
+        self.superuser = get_user_model().objects.create_superuser(username='root', password='root')
+
+    def add_user(self, username, **roles):
+        user = get_user_model().objects.create_user(username=username)
+        manager = user if roles.get('is_manager') else self.manager
+        user.roles = Roles.objects.create(user=user, manager=manager, **roles)
+        if not roles.get('is_manager'):
+            user.roles.branches.add(self.alpha)
+        return user
+
+    def scope(self, user):
+        return AccessScope(get_user_model().objects.get(id=user.id))
+
+    def test_manager(self):
+        scope = self.scope(self.manager)
+        self.assertEqual((scope.manager_id, scope.manager), (self.manager.id, self.manager))
+        self.assertTrue(scope.is_manager)
+        self.assertEqual(set(scope.manager_branches()), {self.alpha, self.bravo, Branches.objects.get(location='Closed')})
+        self.assertEqual(set(scope.open_branches()), {self.alpha, self.bravo})
+        self.assertEqual(set(scope.staff_users()), {self.manager, self.assistant, self.retailer})
+        self.assertEqual(set(scope.branch_staff_users()), set(scope.staff_users()))
+
+    def test_assistant(self):
+        scope = self.scope(self.assistant)
+        self.assertEqual(scope.manager_id, self.manager.id)
+        self.assertEqual((scope.is_manager, scope.is_assistant), (False, True))
+        self.assertEqual(scope.branch_ids, [self.alpha.id])
+        self.assertEqual(scope.module_branch_ids('sale'), [self.bravo.id])
+        self.assertEqual((scope.days(), scope.days('sale')), (7, 3))
+        self.assertEqual(list(scope.open_branches()), [self.alpha])
+        self.assertEqual(set(scope.assignable_branches()), {self.alpha, self.bravo})
+        self.assertEqual(set(scope.branch_staff_users()), {self.assistant, self.retailer})
+
+    def test_retailer(self):
+        scope = self.scope(self.retailer)
+        self.assertEqual((scope.manager_id, scope.is_retailer), (self.manager.id, True))
+        self.assertEqual(list(scope.open_branches()), [self.alpha])
+        self.assertEqual(list(scope.assignable_branches()), [self.alpha])
+        self.assertEqual(scope.days(), 1)
+
+    def test_superuser(self):
+        scope = self.scope(self.superuser)
+        self.assertIsNone(scope.roles)
+        self.assertIsNone(scope.manager_id)
+        self.assertEqual(scope.owned(Branches).count(), Branches.objects.count())
+        self.assertEqual(scope.staff_users().count(), get_user_model().objects.count())
+        self.assertEqual(scope.branch_ids, [])
+
+    def test_get_scope_is_built_once(self):
+        request = RequestFactory().get('/')
+        request.user = get_user_model().objects.get(id=self.retailer.id)
+        scope = get_scope(request)
+        self.assertIs(get_scope(request), scope)
+        self.assertIs(AccessScope.of(request.user), scope)
+
+
+class BranchAdminTest(TestCase):
+
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', is_staff=True)
+        self.manager.user_permissions.set(Permission.objects.all())
+        Roles.objects.create(user=self.manager, manager=self.manager, is_manager=True)
+        self.branch = Branches.objects.create(manager=self.manager, location='Alpha')
+        retailer = get_user_model().objects.create_user(username='retailer')
+        Roles.objects.create(user=retailer, manager=self.manager, is_retailer=True)
+        Current_Branch.objects.create(manager=self.manager, user=retailer, branch=self.branch)
+        other = get_user_model().objects.create_user(username='other')
+        Roles.objects.create(user=other, manager=other, is_manager=True)
+        elsewhere = Branches.objects.create(manager=other, location='Elsewhere')
+        Current_Branch.objects.create(manager=other, user=other, branch=elsewhere)
+        self.client.force_login(self.manager)
+
+    def test_branches_of_manager(self):
+        response = self.client.get('/location/branches/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Alpha')
+        self.assertNotContains(response, 'Elsewhere')
+
+    def test_current_branches_of_manager(self):
+        response = self.client.get('/location/current_branch/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Alpha')
+        self.assertNotContains(response, 'Elsewhere')
+
+    def test_new_branch_belongs_to_manager(self):
+        self.client.post('/location/branches/add/', {'location': 'Bravo', 'is_open': 'on'})
+        self.assertEqual(Branches.objects.get(location='Bravo').manager, self.manager)
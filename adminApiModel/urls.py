@@ -22,11 +22,13 @@ from django.conf import settings
 import private_storage.urls
 
 from finance.views import SalesView
+from adminApiModel import instrumentation
 
 
 urlpatterns = [
     path('private-media/', include(private_storage.urls)),
     path('pos/', include('stock.urls')),
     path('staff/', include('staff.urls')),
+    path('instrumentation/', admin.site.admin_view(instrumentation.dashboard), name='instrumentation'),
     path('', admin.site.urls),
 ]
@@ -1,40 +1,34 @@
+import hashlib
+import uuid
+
 from django.contrib import admin
-from django.contrib.auth import get_user_model
 from django.contrib.admin import SimpleListFilter
 from django.contrib.admin.utils import label_for_field
-from django.db.models import Sum
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR, ORDER_VAR
+from django.core.cache import cache
+from django.db.models import Sum, Prefetch
 from django.db.models.fields import FieldDoesNotExist
 
+from finance.models import Banks, Expense_Types
 from location.models import Branches
+from stock.models import Distributor, Purchase_Payment_Method
 from import_export.admin import ImportExportModelAdmin
 from simple_history.admin import SimpleHistoryAdmin
 
+from .scope import get_scope
+
 
 class FilterBranchDropDown(admin.ModelAdmin):
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "branches" or db_field.name == "sale_branches" or db_field.name == "expense_branches" or db_field.name == "purchase_branches" or db_field.name == "hours_in_branches":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            elif request.user.roles.is_assistant:
-                kwargs["queryset"] = request.user.roles.manager.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = get_scope(request).assignable_branches()
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "branch":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = get_scope(request).open_branches()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
@@ -43,17 +37,7 @@ class FilterStaffDropDown(admin.ModelAdmin):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "staff" or db_field.name == "retailer":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager)
+            kwargs["queryset"] = get_scope(request).staff_users()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
@@ -62,18 +46,7 @@ class FilterBranchSpecificStaffDropDown(admin.ModelAdmin):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "staff" or db_field.name == "retailer" or db_field.name == "user":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager).filter(
-                        roles__branches__in=request.user.roles.branches.all()).distinct()
+            kwargs["queryset"] = get_scope(request).branch_staff_users()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
@@ -82,18 +55,7 @@ class HistoryFilterBranchSpecificStaffDropDown(SimpleHistoryAdmin):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "staff" or db_field.name == "retailer" or db_field.name == "user":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager).filter(
-                        roles__branches__in=request.user.roles.branches.all()).distinct()
+            kwargs["queryset"] = get_scope(request).branch_staff_users()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
@@ -101,39 +63,17 @@ class FilterBranchStaffDropDown(admin.ModelAdmin):
 
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-
+        scope = get_scope(request)
         if db_field.name == "staff" or db_field.name == "retailer" or db_field.name == "user":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager)
+            kwargs["queryset"] = scope.staff_users()
         elif db_field.name == "branch":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = scope.open_branches()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "branches":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = get_scope(request).open_branches()
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 
@@ -141,33 +81,13 @@ class FilterBranchStaffBankDropDown(admin.ModelAdmin):
 
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-
+        scope = get_scope(request)
         if db_field.name == "staff" or db_field.name == "retailer":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager)
+            kwargs["queryset"] = scope.staff_users()
         elif db_field.name == "branch":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = scope.open_branches()
         elif db_field.name == "bank":
-            if request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.banks.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.banks.filter(is_active=True)
-
+            kwargs["queryset"] = scope.active(Banks)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
@@ -175,45 +95,19 @@ class HistoryFilterBranchStaffBankDropDown(admin.ModelAdmin):
 
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-
+        scope = get_scope(request)
         if db_field.name == "staff" or db_field.name == "retailer":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager)
+            kwargs["queryset"] = scope.staff_users()
         elif db_field.name == "branch":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = scope.open_branches()
         elif db_field.name == "bank":
-            if request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.banks.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.banks.filter(is_active=True)
-
+            kwargs["queryset"] = scope.active(Banks)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "branches":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = get_scope(request).open_branches()
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 
@@ -221,50 +115,21 @@ class FilterBranchStaffPurchaseMethodDistributorDropDown(admin.ModelAdmin):
 
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-
+        scope = get_scope(request)
         if db_field.name == "staff" or db_field.name == "retailer":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager)
+            kwargs["queryset"] = scope.staff_users()
         elif db_field.name == "branch":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = scope.open_branches()
         elif db_field.name == 'payment_method':
-            if request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.purchase_payment_methods.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.purchase_payment_methods.filter(is_active=True)
+            kwargs["queryset"] = scope.active(Purchase_Payment_Method)
         elif db_field.name == 'distributor':
-            if request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.distributors.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.distributors.filter(is_active=True)
-
+            kwargs["queryset"] = scope.active(Distributor)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "branches":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
+            kwargs["queryset"] = get_scope(request).open_branches()
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 class BranchFilter(SimpleListFilter):
@@ -272,13 +137,7 @@ class BranchFilter(SimpleListFilter):
     parameter_name = 'branch'
 
     def lookups(self, request, model_admin):
-        if request.user.is_superuser:
-            branches = \
-                Branches.objects.all()
-        elif request.user.roles.is_manager:
-            branches = request.user.branches.all()
-        else:
-            branches = request.user.roles.manager.branches.all()
+        branches = get_scope(request).manager_branches()
         return [(b.id, b.location) for b in branches]
 
     def queryset(self, request, queryset):
@@ -292,10 +151,7 @@ class BankFilter(SimpleListFilter):
     parameter_name = 'bank'
 
     def lookups(self, request, model_admin):
-        if request.user.roles.is_manager:
-            banks = request.user.banks.filter(is_active=True)
-        else:
-            banks = request.user.roles.manager.banks.filter(is_active=True)
+        banks = get_scope(request).active(Banks)
         return [(b.id, b.name) for b in banks]
 
     def queryset(self, request, queryset):
@@ -309,10 +165,7 @@ class ManyBranchFilter(SimpleListFilter):
     parameter_name = 'branch'
 
     def lookups(self, request, model_admin):
-        if request.user.roles.is_manager:
-            branches = request.user.branches.all()
-        else:
-            branches = request.user.roles.manager.branches.all()
+        branches = get_scope(request).manager_branches()
         return [(b.id, b.location) for b in branches]
 
     def queryset(self, request, queryset):
@@ -326,10 +179,7 @@ class ExpenseTypeFilter(SimpleListFilter):
     parameter_name = 'type_of_expense'
 
     def lookups(self, request, model_admin):
-        if request.user.roles.is_manager:
-            expense_types = request.user.expense_types.all()
-        else:
-            expense_types = request.user.roles.manager.expense_types.all()
+        expense_types = get_scope(request).owned(Expense_Types)
         return [(e.id, e.name) for e in expense_types.order_by('name')]
 
     def queryset(self, request, queryset):
@@ -338,12 +188,134 @@ class ExpenseTypeFilter(SimpleListFilter):
         return queryset
 
 
+class BranchColumnChangeList(ChangeList):
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.prefetch_related(Prefetch(self.model_admin.branch_path,
+                                                  queryset=Branches.objects.order_by('location')))
+
+
+class BranchColumnAdmin(admin.ModelAdmin):
+    """
+    Adds a ``branch`` column with the locations of the branches a row's
+    staff is assigned to. branch_path is the lookup from the model to
+    those branches. They are prefetched for the whole page, so the column
+    costs the same few queries whatever the number of rows.
+    """
+    branch_path = None
+
+    def get_changelist(self, request, **kwargs):
+        return BranchColumnChangeList
+
+    def branch(self, obj):
+        *path, name = self.branch_path.split('__')
+        for attname in path:
+            # users without roles have no branches
+            obj = getattr(obj, attname, None)
+            if obj is None:
+                return ""
+        branches = ""
+        for b in getattr(obj, name).all():
+            branches += b.location + " | "
+        return branches
+
+
+# how long changelist totals are cached, in seconds. saves and deletes
+# invalidate them sooner through invalidate_totals
+TOTALS_TIMEOUT = 300
+
+
+def totals_version_key(model, manager_id):
+    return 'totals_version:' + model._meta.label_lower + ':' + str(manager_id)
+
+
+def get_totals_version(model, manager_id):
+    key = totals_version_key(model, manager_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(key, version, None)
+    return version
+
+
+def invalidate_totals(model, manager_id):
+    cache.set(totals_version_key(model, manager_id), uuid.uuid4().hex, None)
+
+
 class TotalsumAdmin(ImportExportModelAdmin):
     # change_list_template = "admin/finance/sales/change_list.html"
     # totalsum_list = ('gross_sales',)
+    # totalsum_expressions = {'short_or_over': F('cash_on_caja') - F('gross_sales')}
 
     unit_of_measure = ""
     totalsum_decimal_places = 2
+    totalsum_expressions = {}
+
+    def get_totalsum_aggregates(self):
+        # every total is summed in the database by a single aggregate query.
+        # entries in totalsum_expressions are summed as the given expression,
+        # which lets properties be totalled without loading the rows
+        aggregates = {}
+        properties = []
+        for elem in self.totalsum_list:
+            if elem in self.totalsum_expressions:
+                aggregates[elem] = Sum(self.totalsum_expressions[elem])
+                continue
+            try:
+                self.model._meta.get_field(elem)  # Checking if elem is a field
+                aggregates[elem] = Sum(elem)
+            except FieldDoesNotExist:  # maybe it's a property
+                if hasattr(self.model, elem):
+                    properties.append(elem)
+        return aggregates, properties
+
+    def get_totals(self, queryset):
+        aggregates, properties = self.get_totalsum_aggregates()
+        sums = {}
+        if aggregates:
+            sums = queryset.aggregate(**aggregates)
+        for elem in properties:
+            # undeclared properties still have to be computed per row
+            total = 0
+            for f in queryset:
+                total += getattr(f, elem, 0)
+            sums[elem] = total
+
+        totals = {}
+        for elem in self.totalsum_list:
+            total = sums.get(elem)
+            if total is None:
+                continue
+            totals[label_for_field(elem, self.model, self)] = \
+                round(total, self.totalsum_decimal_places)
+        return totals
+
+    def get_totals_cache_key(self, request):
+        user = request.user
+        if user.is_superuser:
+            # superusers see every manager's rows
+            return None
+        manager_id = get_scope(request).manager_id
+
+        # paging and sorting do not change the totals
+        params = sorted((k, v) for k, v in request.GET.lists()
+                        if k not in (PAGE_VAR, ORDER_VAR))
+        # the user is part of the key since assistants and retailers
+        # only see some branches and days of their manager
+        state = repr((user.id, params)).encode()
+        return 'totals:' + self.model._meta.label_lower + ':' + str(manager_id) + ':' + \
+            get_totals_version(self.model, manager_id) + ':' + hashlib.md5(state).hexdigest()
+
+    def get_cached_totals(self, request, queryset):
+        key = self.get_totals_cache_key(request)
+        if key is None:
+            return self.get_totals(queryset)
+        totals = cache.get(key)
+        if totals is None:
+            totals = self.get_totals(queryset)
+            cache.set(key, totals, TOTALS_TIMEOUT)
+        return totals
 
     def changelist_view(self, request, extra_context=None):
         response = super(TotalsumAdmin, self).changelist_view(request, extra_context)
@@ -351,27 +323,8 @@ class TotalsumAdmin(ImportExportModelAdmin):
             return response
         filtered_query_set = response.context_data["cl"].queryset
         extra_context = extra_context or {}
-        extra_context["totals"] = {}
+        extra_context["totals"] = self.get_cached_totals(request, filtered_query_set)
         extra_context["unit_of_measure"] = self.unit_of_measure
 
-        for elem in self.totalsum_list:
-            try:
-                self.model._meta.get_field(elem)  # Checking if elem is a field
-                total = filtered_query_set.aggregate(totalsum_field=Sum(elem))[
-                    "totalsum_field"
-                ]
-                if total is not None:
-                    extra_context["totals"][
-                        label_for_field(elem, self.model, self)
-                    ] = round(total, self.totalsum_decimal_places)
-            except FieldDoesNotExist:  # maybe it's a property
-                if hasattr(self.model, elem):
-                    total = 0
-                    for f in filtered_query_set:
-                        total += getattr(f, elem, 0)
-                    extra_context["totals"][
-                        label_for_field(elem, self.model, self)
-                    ] = round(total, self.totalsum_decimal_places)
-
         response.context_data.update(extra_context)
-        return response
\ No newline at end of file
+        return response
@@ -1,12 +1,9 @@
 import datetime, calendar
 
 from django.contrib import admin
-from django.utils import timezone
 from django.contrib.admin import SimpleListFilter
 from django.contrib.admin import DateFieldListFilter
-from django.db.models import Sum
-from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.db.models import Sum, F
 
 from io import BytesIO
 from reportlab.pdfgen import canvas
@@ -18,16 +15,18 @@ from import_export.widgets import ForeignKeyWidget
 from rangefilter.filter import DateRangeFilter
 
 from location.models import Branches
-from stock.models import Purchases
-from staff.models import Bimonthly_In
 from finance.models  import Sales, Expense_Types, Expense_Methods, \
                             Banks, Expenses, Bank_Status
+from finance import ledger, reports
+from jobs import queue
+from jobs.admin import job_queued_response
 from adminApiModel.utils import FilterBranchStaffDropDown, \
                                 FilterBranchStaffBankDropDown, \
                                 BranchFilter, \
                                 BankFilter, \
                                 ExpenseTypeFilter, \
                                 TotalsumAdmin, HistoryFilterBranchStaffBankDropDown
+from adminApiModel.scope import get_scope
 
 
 class SalesResource(resources.ModelResource):
@@ -52,6 +51,10 @@ class SalesResource(resources.ModelResource):
 class CustomSaleAdmin(TotalsumAdmin, HistoryFilterBranchStaffBankDropDown):
     change_list_template = "admin/utils/change_list.html"
     totalsum_list = ('gross_sales','cash_on_caja', 'short_or_over', 'caja_minus_deposit', 'cash_for_deposit')
+    totalsum_expressions = {
+        'short_or_over': F('cash_on_caja') - F('gross_sales'),
+        'caja_minus_deposit': F('cash_on_caja') - F('cash_for_deposit'),
+    }
     resource_class = SalesResource
     list_per_page = 10
     ordering = ['-date', 'branch']
@@ -98,34 +101,7 @@ class CustomSaleAdmin(TotalsumAdmin, HistoryFilterBranchStaffBankDropDown):
 
 
     def get_queryset(self, request):
-        user = request.user
-        if user.is_superuser:
-            return super().get_queryset(request)
-        elif user.roles.is_manager:
-            return super().get_queryset(request
-                   ).filter(manager=user)
-        elif user.roles.is_assistant:
-            days = user.roles.sale_days
-            branches = user.roles.sale_branches.all()
-            if days and branches:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=days)
-                       ).filter(branch__in=branches)
-            else:
-                raise RuntimeError("User is assistant but roles improperly configured")
-        elif user.roles.is_retailer:
-            days = user.roles.days
-            if days:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=days)
-                       ).filter(branch__in=user.roles.branches.all())
-            else:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=1)
-                       ).filter(branch__in=user.roles.branches.all())
+        return super().get_queryset(request).for_user(request.user, 'sale')
 
         # elif user.roles.is_retailer:
         #     return super().get_queryset(request
@@ -153,10 +129,8 @@ class CustomSaleAdmin(TotalsumAdmin, HistoryFilterBranchStaffBankDropDown):
         if (not bank_status) and form.instance.was_deposited:
             if request.user.is_superuser:
                 manager = request.user
-            elif request.user.roles.is_manager:
-                manager = request.user
             else:
-                manager = request.user.roles.manager
+                manager = get_scope(request).manager
             Bank_Status(manager=manager,
                         bank=form.instance.bank,
                         date=datetime.datetime.combine(form.instance.date, datetime.datetime.now().time()),
@@ -322,34 +296,7 @@ class CustomExpenseAdmin(TotalsumAdmin):
 
 
     def get_queryset(self, request):
-        user = request.user
-        if user.is_superuser:
-            return super().get_queryset(request)
-        elif user.roles.is_manager:
-            return super().get_queryset(request
-                   ).filter(manager=user)
-        elif user.roles.is_assistant:
-            days = user.roles.expense_days
-            branches = user.roles.expense_branches.all()
-            if days and branches:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=days)
-                       ).filter(branch__in=branches)
-            else:
-                raise RuntimeError("User is assistant but roles improperly configured")
-        elif user.roles.is_retailer:
-            days = user.roles.days
-            if days:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=days)
-                       ).filter(branch__in=user.roles.branches.all())
-            else:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=1)
-                       ).filter(branch__in=user.roles.branches.all())
+        return super().get_queryset(request).for_user(request.user, 'expense')
 
 
     def save_related(self, request, form, formsets, change):
@@ -361,10 +308,8 @@ class CustomExpenseAdmin(TotalsumAdmin):
         if (not bank_status) and form.instance.is_valid and form.instance.bank:
             if request.user.is_superuser:
                 manager = request.user
-            elif request.user.roles.is_manager:
-                manager = request.user
             else:
-                manager = request.user.roles.manager
+                manager = get_scope(request).manager
             Bank_Status(manager=manager,
                         bank=form.instance.bank,
                         date=datetime.datetime.combine(form.instance.date, datetime.datetime.now().time()),
@@ -378,60 +323,17 @@ class CustomExpenseAdmin(TotalsumAdmin):
 
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-
+        scope = get_scope(request)
         if db_field.name == "staff" or db_field.name == "retailer":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    get_user_model().objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user)
-            else:
-                kwargs["queryset"] = \
-                    get_user_model().objects.filter(
-                        roles__manager=request.user.roles.manager)
-
-
+            kwargs["queryset"] = scope.staff_users()
         elif db_field.name == "branch":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
-            else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True)
-
-
+            kwargs["queryset"] = scope.open_branches()
         elif db_field.name == "type_of_expense":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Expense_Types.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.expense_types.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.expense_types.filter(is_active=True)
-
-
+            kwargs["queryset"] = scope.active(Expense_Types)
         elif db_field.name == "method_of_payment":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Expense_Methods.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.expense_methods.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.expense_methods.filter(is_active=True)
-
-
+            kwargs["queryset"] = scope.active(Expense_Methods)
         elif db_field.name == "bank":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Banks.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.banks.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.banks.filter(is_active=True)
-
+            kwargs["queryset"] = scope.active(Banks)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
@@ -443,54 +345,52 @@ class CustomExpenseAdmin(TotalsumAdmin):
         if not request.user.roles.is_manager:
             raise RuntimeError("User must be a manager to perform this action")
 
+        startDate = queryset.order_by('date')[0].date
+        endDate = queryset.order_by('-date')[0].date
+        job = queue.enqueue(request.user.id, request.user, 'weekly', startDate=startDate, endDate=endDate)
+        return job_queued_response(self, request, job)
+    expense_weekly_report.short_description = "Generate Weekly Report"
+
+
+    def renderWeeklyReport(manager, startDate, endDate):
         constant_body_top = 740
 
-        response = CustomExpenseAdmin.getResponse()
         p, buffer = CustomExpenseAdmin.getPage()
-        headerInfo = CustomExpenseAdmin.getHeaderInfo(queryset)
+        headerInfo = CustomExpenseAdmin.getHeaderInfo(manager, startDate, endDate)
 
         p = CustomExpenseAdmin.addHeader(p, headerInfo)
-        sales, complete_total_sales = CustomExpenseAdmin.getSales(headerInfo['startDate'], headerInfo['endDate'], headerInfo['branches'])
+        sales, complete_total_sales = CustomExpenseAdmin.getSales(headerInfo['startDate'], headerInfo['endDate'], headerInfo['branches'], manager)
         new_body_top = CustomExpenseAdmin.addTable(p, sales, constant_body_top, "Sales", constant_body_top, headerInfo, "weekly")
         
         expenseTypes = []
-        expenseTypeObjects = Expense_Types.objects.filter(is_active=True).filter(manager=request.user)
+        expenseTypeObjects = Expense_Types.objects.filter(is_active=True).filter(manager=manager)
         for expType in expenseTypeObjects:
             expenseTypes.append(expType.name)
 
+        expense_totals = reports.expenses_by_branch_type_date(manager, headerInfo['startDate'], headerInfo['endDate'])
         all_branch_expense_total = 0
         for num in range(len(headerInfo['branches'])):
-            expenses, complete_total_expense = CustomExpenseAdmin.getExpenses(headerInfo['startDate'], headerInfo['endDate'], expenseTypes, headerInfo['branches'][num])
+            expenses, complete_total_expense = CustomExpenseAdmin.getExpenses(headerInfo['startDate'], headerInfo['endDate'], expenseTypes, headerInfo['branches'][num], expense_totals)
             all_branch_expense_total += float(complete_total_expense.translate({ord(i): None for i in ', '}))
             new_body_top = CustomExpenseAdmin.addTable(p, expenses, new_body_top, "Expenses - " + headerInfo['branches'][num], constant_body_top, headerInfo, "weekly")
 
         p = CustomExpenseAdmin.addSummary(p, complete_total_sales, all_branch_expense_total, constant_body_top, headerInfo)
 
-        response = CustomExpenseAdmin.addPageToResponse(p, buffer, response)
-        
-        return response
-    expense_weekly_report.short_description = "Generate Weekly Report"
+        return CustomExpenseAdmin.getPdf(p, buffer)
 
 
-    def getResponse():
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'inline; filename="weekly_report.pdf"'
-        filename = "weekly_report.pdf"
-        return response
-    
     def getPage():
         buffer = BytesIO()
         p = canvas.Canvas(buffer)
         p.setPageSize(A4)
         return p, buffer
 
-    def getHeaderInfo(queryset):
+    def getHeaderInfo(manager, startDate, endDate):
         headerInfo = {}
-        headerInfo['startDate'] = queryset.order_by('date')[0].date
-        headerInfo['endDate'] = queryset.order_by('-date')[0].date
+        headerInfo['startDate'] = startDate
+        headerInfo['endDate'] = endDate
 
         branches = []
-        manager = queryset[0].manager
         for branch in Branches.objects.filter(manager=manager):
             if branch.location == "BTS MAUBAN":
                 continue
@@ -514,17 +414,16 @@ class CustomExpenseAdmin(TotalsumAdmin):
         p.drawString(25, top_loc - 60, "Branches: " + ' | '.join(headerInfo['branches']))
         return p
 
-    def getSales(startDate, endDate, branches):
-        sale_objects = Sales.objects.filter(date__range=[startDate, endDate])
-        table, complete_total_sales = CustomExpenseAdmin.getTable(startDate, endDate, sale_objects, branches, "sale", None)
+    def getSales(startDate, endDate, branches, manager):
+        sale_totals = reports.sales_by_branch_date(manager, startDate, endDate)
+        table, complete_total_sales = CustomExpenseAdmin.getTable(startDate, endDate, sale_totals, branches, "sale", None)
         return table, complete_total_sales
 
-    def getExpenses(startDate, endDate, expenseTypes, expense_branch_name):
-        expense_objects = Expenses.objects.filter(date__range=[startDate, endDate])
-        table, complete_total_expenses = CustomExpenseAdmin.getTable(startDate, endDate, expense_objects, expenseTypes, "expense", expense_branch_name)
+    def getExpenses(startDate, endDate, expenseTypes, expense_branch_name, expense_totals):
+        table, complete_total_expenses = CustomExpenseAdmin.getTable(startDate, endDate, expense_totals, expenseTypes, "expense", expense_branch_name)
         return table, complete_total_expenses
 
-    def getTable(startDate, endDate, objects, iterable, tableType, expense_branch_name):
+    def getTable(startDate, endDate, totals, iterable, tableType, expense_branch_name):
         if tableType == "sale":
             heading = "Branch"
         elif tableType == "expense":
@@ -546,30 +445,23 @@ class CustomExpenseAdmin(TotalsumAdmin):
         for date in days:
             daily_total.append(0)
 
-        table, complete_total = CustomExpenseAdmin.getTableContents(table, objects, iterable, days, daily_total, tableType, expense_branch_name)
+        table, complete_total = CustomExpenseAdmin.getTableContents(table, totals, iterable, days, daily_total, tableType, expense_branch_name)
 
         return table, complete_total
 
-    def getTableContents(table, objects, iterable, days, daily_total, tableType, expense_branch_name):        
+    def getTableContents(table, totals, iterable, days, daily_total, tableType, expense_branch_name):
+        # totals come from the grouped queries in finance.reports, keyed
+        # by (branch, date) for sales and (branch, type, date) for expenses
         for i in iterable:
-            if tableType == "sale":
-                i_object = objects.filter(branch__location=i)
-            elif tableType == "expense":
-                i_object = objects.filter(branch__location=expense_branch_name).filter(type_of_expense__name=i)
-
             daily_total_index = -1            
             table_row = [i]
             i_weekly_sale_total = 0
             for date in days:
                 daily_total_index += 1
-                try:
-                    if tableType == "sale":
-                        i_value = i_object.filter(date=date).get().gross_sales
-                    elif tableType == "expense":
-                        i_value = i_object.filter(date=date).get().amount
-
-                except:
-                    i_value = 0
+                if tableType == "sale":
+                    i_value = totals.get((i, date), 0)
+                elif tableType == "expense":
+                    i_value = totals.get((expense_branch_name, i, date), 0)
                 table_row.append('{:,.2f}'.format(i_value).replace(',', ', '))
                 i_weekly_sale_total += i_value
 
@@ -626,12 +518,11 @@ class CustomExpenseAdmin(TotalsumAdmin):
         return p
 
 
-    def addPageToResponse(p, buffer, response):
+    def getPdf(p, buffer):
         p.save()
         pdf = buffer.getvalue()
         buffer.close()
-        response.write(pdf)
-        return response
+        return pdf
 
 
     def expense_monthly_report(self, request, queryset):
@@ -640,38 +531,40 @@ class CustomExpenseAdmin(TotalsumAdmin):
 
         if not request.user.roles.is_manager:
             raise RuntimeError("User must be a manager to perform this action")
-        
+
+        date = queryset.order_by('-date')[0].date
+        job = queue.enqueue(request.user.id, request.user, 'monthly', date=date)
+        return job_queued_response(self, request, job)
+    expense_monthly_report.short_description = "Generate Monthly Report"
+
+
+    def renderMonthlyReport(manager, date):
         constant_body_top = 770
 
-        response = CustomExpenseAdmin.getResponse()
         p, buffer = CustomExpenseAdmin.getPage()
-        headerInfo = CustomExpenseAdmin.getHeaderInfoMonthly(queryset)
+        headerInfo = CustomExpenseAdmin.getHeaderInfoMonthly(manager, date)
 
         p = CustomExpenseAdmin.addHeaderMonthly(p, headerInfo)
 
-        sales, complete_total_sales, per_branch_total = CustomExpenseAdmin.getSalesMonthly(headerInfo['date'], headerInfo['branches'], request.user)
+        sales, complete_total_sales, per_branch_total = CustomExpenseAdmin.getSalesMonthly(headerInfo['date'], headerInfo['branches'], manager)
         new_body_top = CustomExpenseAdmin.addTable(p, sales, constant_body_top, "Sales", constant_body_top, headerInfo, "monthly")
 
-        expenses, complete_total_expenses, _ = CustomExpenseAdmin.getExpensesMonthly(headerInfo['date'], headerInfo['branches'], request.user)
+        expenses, complete_total_expenses, _ = CustomExpenseAdmin.getExpensesMonthly(headerInfo['date'], headerInfo['branches'], manager)
         new_body_top = CustomExpenseAdmin.addTable(p, expenses, new_body_top, "Expenses", constant_body_top, headerInfo, "monthly")
 
-        purchases, complete_total_purchases, _ = CustomExpenseAdmin.getPurchasesMonthly(headerInfo['date'], headerInfo['branches'], request.user, per_branch_total)
+        purchases, complete_total_purchases, _ = CustomExpenseAdmin.getPurchasesMonthly(headerInfo['date'], headerInfo['branches'], manager, per_branch_total)
         new_body_top = CustomExpenseAdmin.addTable(p, purchases, new_body_top, "Purchases", constant_body_top, headerInfo, "monthly")
         
         p = CustomExpenseAdmin.addSummaryMonthly(p, complete_total_sales, complete_total_expenses, complete_total_purchases, headerInfo, constant_body_top)
 
-        response = CustomExpenseAdmin.addPageToResponse(p, buffer, response)
-        
-        return response
-    expense_monthly_report.short_description = "Generate Monthly Report"
+        return CustomExpenseAdmin.getPdf(p, buffer)
 
 
-    def getHeaderInfoMonthly(queryset):
+    def getHeaderInfoMonthly(manager, date):
         headerInfo = {}
-        headerInfo['date'] = queryset.order_by('-date')[0].date
+        headerInfo['date'] = date
 
         branches = []
-        manager = queryset[0].manager
         for branch in Branches.objects.filter(manager=manager):
             if branch.location == "BTS MAUBAN":
                 continue
@@ -690,54 +583,45 @@ class CustomExpenseAdmin(TotalsumAdmin):
         p.drawString(25, top_loc - 40, "Branches: " + ' | '.join(headerInfo['branches']))
         return p
 
-    def getSalesMonthly(date, branches, user):
+    def getMonthRange(date):
         _, endDay = calendar.monthrange(date.year, date.month)
-        startDate = date.replace(day=1)
-        endDate = date.replace(day=endDay)
-        sale_objects = Sales.objects.filter(date__range=[startDate, endDate])
-        table, complete_total_sales, per_branch_total = CustomExpenseAdmin.getTableMonthly(startDate, endDate, branches, sale_objects, "sale", user, _)
+        return date.replace(day=1), date.replace(day=endDay)
+
+    def getSalesMonthly(date, branches, user):
+        startDate, endDate = CustomExpenseAdmin.getMonthRange(date)
+        sale_totals = reports.sales_by_branch_date(user, startDate, endDate)
+        table, complete_total_sales, per_branch_total = CustomExpenseAdmin.getTableMonthly(startDate, endDate, branches, sale_totals, "sale", user, None)
         return table, complete_total_sales, per_branch_total
 
     def getExpensesMonthly(date, branches, user):
-        _, endDay = calendar.monthrange(date.year, date.month)
-        startDate = date.replace(day=1)
-        endDate = date.replace(day=endDay)
-        expense_objects = Expenses.objects.filter(date__range=[startDate, endDate])
-        table, complete_total_expenses, _ = CustomExpenseAdmin.getTableMonthly(startDate, endDate, branches, expense_objects, "expense", user, _)
+        startDate, endDate = CustomExpenseAdmin.getMonthRange(date)
+        expense_totals = reports.expenses_by_type_branch(user, startDate, endDate)
+        table, complete_total_expenses, _ = CustomExpenseAdmin.getTableMonthly(startDate, endDate, branches, expense_totals, "expense", user, None)
         return table, complete_total_expenses, _
 
     def getPurchasesMonthly(date, branches, user, per_branch_total):
-        _, endDay = calendar.monthrange(date.year, date.month)
-        startDate = date.replace(day=1)
-        endDate = date.replace(day=endDay)
-        purchase_objects = Purchases.objects.filter(date__range=[startDate, endDate])
-        table, complete_total_purchases, _ = CustomExpenseAdmin.getTableMonthly(startDate, endDate, branches, purchase_objects, "purchase", user, per_branch_total)
+        startDate, endDate = CustomExpenseAdmin.getMonthRange(date)
+        purchase_totals = reports.purchases_by_branch_date(user, startDate, endDate)
+        table, complete_total_purchases, _ = CustomExpenseAdmin.getTableMonthly(startDate, endDate, branches, purchase_totals, "purchase", user, per_branch_total)
         return table, complete_total_purchases, _
 
-    def getTableMonthly(startDate, endDate, branches, objects, tableType, user, per_branch_total):
-        days = []
-        for num in range((endDate - startDate).days + 1):
-            days.append((startDate + datetime.timedelta(days=num)))
-
-        types = []
-        for t in Expense_Types.objects.filter(manager=user).filter(is_active=True):
-            types.append(t.name)
-
-        days_purchased = []
-        for p in objects:
-            days_purchased.append(p.date)
-        days_purchased = list(set(days_purchased))
-        days_purchased.sort()
-
+    def getTableMonthly(startDate, endDate, branches, totals, tableType, user, per_branch_total):
+        # totals come from the grouped queries in finance.reports, keyed
+        # by (branch, date) for sales and purchases and (type, branch)
+        # for expenses
         if tableType == "sale":
             column1Title = "Date"
-            rows = days
+            rows = []
+            for num in range((endDate - startDate).days + 1):
+                rows.append((startDate + datetime.timedelta(days=num)))
         elif tableType == "expense":
             column1Title = "Type"
-            rows = types
+            rows = []
+            for t in Expense_Types.objects.filter(manager=user).filter(is_active=True):
+                rows.append(t.name)
         elif tableType == "purchase":
             column1Title = "Date"
-            rows = days_purchased
+            rows = sorted(set(date for _, date in totals))
 
         heading = [column1Title]
         branch_total = []
@@ -749,12 +633,16 @@ class CustomExpenseAdmin(TotalsumAdmin):
         table = [
             heading
         ]
+
+        salary = None
+        if tableType == "expense":
+            salary = reports.payroll_by_branch(user, startDate, endDate)
         
-        table, complete_total, per_branch_total = CustomExpenseAdmin.getTableContentsMonthly(table, objects, rows, branch_total, branches, tableType, per_branch_total, startDate, endDate)
+        table, complete_total, per_branch_total = CustomExpenseAdmin.getTableContentsMonthly(table, totals, rows, branch_total, branches, tableType, per_branch_total, salary)
 
         return table, complete_total, per_branch_total
 
-    def getTableContentsMonthly(table, objects, rows, daily_total, branches, tableType, per_branch_total, startDate, endDate):
+    def getTableContentsMonthly(table, totals, rows, daily_total, branches, tableType, per_branch_total, salary):
         if tableType == "sale":
             per_branch_total = {}
             for branch in branches:
@@ -764,13 +652,7 @@ class CustomExpenseAdmin(TotalsumAdmin):
             salary_row = []
             salary_total = 0
             for branch in branches:
-                branch_salary = 0
-                bimonthly_objects = Bimonthly_In.objects.filter(staff__roles__branches__location=branch)
-                bimonthly_objects = bimonthly_objects.filter(date__range=[startDate, endDate])
-                for b in bimonthly_objects:
-                    branch_salary += b.pay_reg
-                    branch_salary += b.pay_hd
-                    branch_salary += b.pay_shd
+                branch_salary = salary.get(branch, 0)
                 salary_total += branch_salary
                 salary_row.append(branch_salary)
             salary_row.append(salary_total)
@@ -782,29 +664,17 @@ class CustomExpenseAdmin(TotalsumAdmin):
 
             if tableType == "sale":            
                 table_row = [i.strftime("%b %d")]
-                i_object = objects.filter(date=i)
             elif tableType == "expense":            
                 table_row = [i]
-                i_object = objects.filter(type_of_expense__name=i)
             elif tableType == "purchase":            
                 table_row = [i.strftime("%b %d")]
-                i_object = objects.filter(date=i)
 
             for branch in branches:
                 branch_total_index += 1
-                try:
-                    if tableType == "sale":
-                        i_value = i_object.filter(branch__location=branch).get().gross_sales
-                    elif tableType == "expense":
-                        i_value = 0
-                        for expense in i_object.filter(branch__location=branch):
-                            i_value += expense.amount
-                    elif tableType == "purchase":
-                        i_value = 0
-                        for purchase in i_object.filter(branch__location=branch):
-                            i_value += purchase.invoice_worth
-                except:
-                    i_value = 0
+                if tableType == "expense":
+                    i_value = totals.get((i, branch), 0)
+                else:
+                    i_value = totals.get((branch, i), 0)
 
                 table_row.append('{:,.2f}'.format(i_value).replace(',', ', '))
                 i_weekly_total += i_value
@@ -884,7 +754,8 @@ class CustomBankStatusAdmin(TotalsumAdmin):
                    ('date', DateRangeFilter),
                    ('date', DateFieldListFilter),
     ]
-    list_per_page = 10
+    list_per_page = 200
+    list_select_related = ('bank',)
     readonly_fields = ('deposit', 'withdraw', 'total', 'error')
     fields = ('deposit', 'withdraw', 'total', 'date', 'update', 'error', 'remark', 'check', 'online', 'image')
 
@@ -919,23 +790,7 @@ class CustomBankStatusAdmin(TotalsumAdmin):
         return form
 
     def get_total(self, request):
-        user = request.user
-        if user.roles.is_manager:
-            banks = user.banks
-            m_bank_status = user.bank_statuses
-        else:
-            banks = user.roles.manager.banks
-            m_bank_status = user.roles.manager.bank_statuses
-        total = 0
-        for b in banks.all():
-            filtered_bank_status =  m_bank_status.filter(bank=b)
-            if filtered_bank_status:
-                latest = filtered_bank_status.order_by('-date').first()
-                if latest.update:
-                    total += latest.update
-                else:
-                    total += latest.total()
-        return str(total)
+        return str(ledger.get_present_total(get_scope(request).manager_id))
 
     def changelist_view(self, request, extra_context=None):
         my_context = {
@@ -0,0 +1,172 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, OuterRef, Subquery
+from django.utils import timezone
+
+
+# how long the present total of a manager's banks is cached, in seconds
+PRESENT_TOTAL_TIMEOUT = 60
+
+
+# A bank status' running total is the balance carried over from the
+# previous record of the same bank plus its own deposit/withdraw. The
+# carried balance is the previous record's update when one was entered,
+# otherwise the previous record's running total. Records are ordered by
+# (date, id).
+
+
+def position(date, pk):
+    if settings.USE_TZ and timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return (date, pk)
+
+
+def carried_balance(prev):
+    if prev is None:
+        return 0
+    if prev.update:
+        return prev.update
+    return prev.running_total
+
+
+def get_prev(bank_id, date, pk):
+    from finance.models import Bank_Status
+
+    before = Q(date__lt=date)
+    if pk is not None:
+        before |= Q(date=date, id__lt=pk)
+    return Bank_Status.objects.filter(bank_id=bank_id
+                             ).filter(before
+                             ).only('id', 'update', 'running_total'
+                             ).order_by('-date', '-id'
+                             ).first()
+
+
+def recompute(bank_id, start, dirty):
+    """
+    Recompute the running totals of a bank from position ``start``
+    onwards, where positions are (date, id) tuples. Walking stops at the
+    first record past ``dirty`` whose stored total is already correct,
+    since nothing after it can have changed.
+    """
+    from finance.models import Bank_Status
+
+    start_date, start_pk = start
+    prev = get_prev(bank_id, start_date, start_pk)
+    balance = carried_balance(prev)
+    update = prev.update if prev else None
+
+    after = Q(date__gt=start_date) | Q(date=start_date)
+    if start_pk is not None:
+        after = Q(date__gt=start_date) | Q(date=start_date, id__gte=start_pk)
+    records = Bank_Status.objects.filter(bank_id=bank_id
+                                ).filter(after
+                                ).only('id', 'date', 'deposit', 'withdraw', 'update', 'running_total'
+                                ).order_by('date', 'id')
+
+    changed = []
+    for record in records.iterator():
+        total = (update if update else balance) + record.get_deposit_withdraw()
+        if total == record.running_total and (record.date, record.id) > dirty:
+            break
+        if total != record.running_total:
+            record.running_total = total
+            changed.append(record)
+        balance = total
+        update = record.update
+
+    if changed:
+        Bank_Status.objects.bulk_update(changed, ['running_total'], batch_size=500)
+    return changed
+
+
+def record_saved(instance, previous):
+    """
+    Update the ledger after ``instance`` was saved. ``previous`` holds the
+    bank_id and date the record had before the save, or None when it was
+    just created.
+    """
+    new = position(instance.date, instance.id)
+    invalidate_on_commit(instance.manager_id)
+    with transaction.atomic():
+        if previous is None:
+            changed = recompute(instance.bank_id, new, new)
+        elif previous['bank_id'] != instance.bank_id:
+            old = position(previous['date'], instance.id)
+            recompute(previous['bank_id'], old, old)
+            changed = recompute(instance.bank_id, new, new)
+        else:
+            old = position(previous['date'], instance.id)
+            changed = recompute(instance.bank_id, min(old, new), max(old, new))
+
+    for record in changed:
+        if record.id == instance.id:
+            instance.running_total = record.running_total
+
+
+def record_deleted(instance):
+    deleted = position(instance.date, instance.id)
+    invalidate_on_commit(instance.manager_id)
+    with transaction.atomic():
+        recompute(instance.bank_id, deleted, deleted)
+
+
+def rebuild(bank_id):
+    from finance.models import Bank_Status
+
+    first = Bank_Status.objects.filter(bank_id=bank_id).order_by('date', 'id').first()
+    if not first:
+        return 0
+    last = Bank_Status.objects.filter(bank_id=bank_id).order_by('-date', '-id').first()
+    with transaction.atomic():
+        # dirty up to the last record so every total gets checked
+        return len(recompute(bank_id, (first.date, first.id), (last.date, last.id)))
+
+
+def present_total_key(manager_id):
+    return 'bank_present_total:' + str(manager_id)
+
+
+def get_bank_balances(manager_id):
+    """
+    Return {bank id: present balance} for every bank of the manager in a
+    single query. The present balance of a bank is the update of its latest
+    status when one was entered, otherwise that status' running total.
+    """
+    from finance.models import Banks, Bank_Status
+
+    latest = Bank_Status.objects.filter(manager_id=manager_id
+                                ).filter(bank=OuterRef('pk')
+                                ).order_by('-date', '-id')
+    banks = Banks.objects.filter(manager_id=manager_id
+                        ).annotate(latest_update=Subquery(latest.values('update')[:1]),
+                                   latest_total=Subquery(latest.values('running_total')[:1])
+                        ).values_list('id', 'latest_update', 'latest_total')
+
+    balances = {}
+    for bank_id, latest_update, latest_total in banks:
+        if latest_update:
+            balances[bank_id] = latest_update
+        elif latest_total is not None:
+            balances[bank_id] = latest_total
+    return balances
+
+
+def get_present_total(manager_id):
+    key = present_total_key(manager_id)
+    total = cache.get(key)
+    if total is None:
+        total = sum(get_bank_balances(manager_id).values())
+        cache.set(key, total, PRESENT_TOTAL_TIMEOUT)
+    return total
+
+
+def invalidate_present_total(manager_id):
+    cache.delete(present_total_key(manager_id))
+
+
+def invalidate_on_commit(manager_id):
+    # deleted before the commit, a concurrent request could cache the total
+    # the other requests still see again until it times out
+    transaction.on_commit(lambda: invalidate_present_total(manager_id))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from finance import ledger
+from finance.models import Banks
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored running totals of every bank status'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bank', type=int, help='only rebuild the bank with this id')
+
+    def handle(self, *args, **options):
+        banks = Banks.objects.all()
+        if options['bank']:
+            banks = banks.filter(id=options['bank'])
+        for bank in banks:
+            changed = ledger.rebuild(bank.id)
+            self.stdout.write(str(bank) + ": " + str(changed) + " records updated")
@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from finance import summary
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily branch summaries between two dates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, required=True, help='first date, YYYY-MM-DD')
+        parser.add_argument('--end', type=parse_date, required=True, help='last date, YYYY-MM-DD')
+        parser.add_argument('--manager', type=int, help='only rebuild the summaries of the manager with this id')
+
+    def handle(self, *args, **options):
+        count = summary.rebuild(options['start'], options['end'], options['manager'])
+        self.stdout.write(str(count) + " daily summaries rebuilt")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from adminApiModel import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Time the admin pages, reports, payroll and POS API on generated data, in a test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1, help='number of managers to generate')
+        parser.add_argument('--days', type=int, default=365, help='days of records per manager')
+        parser.add_argument('--repeat', type=int, default=3, help='runs of each benchmark')
+        parser.add_argument('--output', default='benchmark.json', help='file the results are written to')
+
+    def handle(self, *args, **options):
+        results = benchmark.benchmark(options['size'], options['days'], options['repeat'])
+        benchmark.save(results, options['output'])
+        for name, result in results['results'].items():
+            self.stdout.write(name + ": " + str(result['median_ms']) + " ms, " + str(result['queries']) + " queries")
+        self.stdout.write("Results written to " + options['output'])
@@ -7,6 +7,8 @@ from simple_history.models import HistoricalRecords
 
 from location.models import Branches
 from adminApiModel.validators import file_size_15
+from adminApiModel.querysets import ScopedManager
+from finance import ledger
 
 
 class Sales(models.Model):
@@ -52,11 +54,16 @@ class Sales(models.Model):
     file = PrivateFileField(blank=True, null=True, upload_to=user_directory_path, max_file_size=15728640)
     history = HistoricalRecords()
 
+    objects = ScopedManager()
+
 
 
     class Meta:
         verbose_name = "Sale Report"
         verbose_name_plural = "Sales Report"
+        indexes = [
+            models.Index(fields=['manager', 'branch', 'date'], name='sales_manager_branch_date'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['manager',
@@ -207,10 +214,15 @@ class Expenses(models.Model):
     attch_doc = PrivateFileField(blank=True, null=True, upload_to=user_directory_path_attch_doc, max_file_size=15728640)
     doc_desc = models.CharField(max_length=64, default='extra-doc', blank=True)
 
+    objects = ScopedManager()
+
 
     class Meta:
         verbose_name = "Expense Report"
         verbose_name_plural = "Expenses Report"
+        indexes = [
+            models.Index(fields=['manager', 'branch', 'date'], name='expenses_manager_branch_date'),
+        ]
 
 
     def __str__(self):
@@ -253,6 +265,7 @@ class Bank_Status(models.Model):
     withdraw = models.FloatField(blank=True, null=True)
     date = models.DateTimeField()
     update = models.FloatField(blank=True, null=True)
+    running_total = models.FloatField(default=0, editable=False)
     remark = models.CharField(max_length=256, default='', blank=True)
     check = models.BooleanField(default=False)
     online = models.BooleanField(default=False)
@@ -309,26 +322,17 @@ class Bank_Status(models.Model):
     def __str__(self):
         return str(self.bank) + " " + str(self.date)
 
-    def total(self):
-        date = self.date
-        bank = self.bank
-        prev_record = self.get_prev(date, bank)
-        if not prev_record:
-            return self.get_deposit_withdraw()
-
-        elif not prev_record.update:
-            return prev_record.total() + self.get_deposit_withdraw()
-
-        elif prev_record.update:
-            return prev_record.update + self.get_deposit_withdraw()
-
-
+    def save(self, *args, **kwargs):
+        previous = None
+        if self.id:
+            previous = Bank_Status.objects.filter(id=self.id).values('bank_id', 'date').first()
+        result = super(Bank_Status, self).save(*args, **kwargs)
+        ledger.record_saved(self, previous)
+        return result
 
-    def get_prev(self, date, bank):
-        m_bank_status = Bank_Status.objects.filter(bank=bank).filter(date__lt=date).order_by('-date')
-        if not m_bank_status:
-            return None
-        return m_bank_status.first()
+    def total(self):
+        return self.running_total
+    total.admin_order_field = 'running_total'
 
     def get_deposit_withdraw(self):
         if self.deposit:
@@ -339,5 +343,63 @@ class Bank_Status(models.Model):
 
     def error(self):
         if self.update:
-            return self.update - self.total()
-        return None
\ No newline at end of file
+            return self.update - self.running_total
+        return None
+
+
+class Daily_Branch_Summary(models.Model):
+    # maintained by finance.summary from the valid sales, expenses,
+    # purchases and payroll of a branch on a given date
+    manager = models.ForeignKey(get_user_model(),
+                                on_delete=models.CASCADE,
+                                related_name='daily_branch_summaries')
+    branch = models.ForeignKey(Branches,
+                                on_delete=models.CASCADE,
+                                related_name='daily_summaries')
+    date = models.DateField()
+    gross_sales = models.FloatField(default=0)
+    cash_on_caja = models.FloatField(default=0)
+    cash_for_deposit = models.FloatField(default=0)
+    expenses = models.FloatField(default=0)
+    purchases = models.FloatField(default=0)
+    payroll = models.FloatField(default=0)
+
+
+    class Meta:
+        verbose_name = "Daily Branch Summary"
+        verbose_name_plural = "Daily Branch Summaries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['manager',
+                        'branch',
+                        'date',],
+                name='unique daily branch summary')
+        ]
+
+
+    def __str__(self):
+        return str(self.branch) + " " + str(self.date)
+
+
+class Daily_Expense_Summary(models.Model):
+    summary = models.ForeignKey('Daily_Branch_Summary',
+                                on_delete=models.CASCADE,
+                                related_name='expense_types')
+    type_of_expense = models.ForeignKey('Expense_Types',
+                                on_delete=models.CASCADE)
+    amount = models.FloatField(default=0)
+
+
+    class Meta:
+        verbose_name = "Daily Expense Summary"
+        verbose_name_plural = "Daily Expense Summaries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['summary',
+                        'type_of_expense',],
+                name='unique daily expense summary')
+        ]
+
+
+    def __str__(self):
+        return str(self.summary) + " " + str(self.type_of_expense)
@@ -0,0 +1,74 @@
+from finance.models import Daily_Branch_Summary, Daily_Expense_Summary
+
+
+# Grouped queries behind the weekly and monthly reports. Each returns a
+# dict of totals keyed by the report cell so that the tables can be
+# assembled in memory, whatever the number of branches, types or days.
+# They read the daily summaries kept by finance.summary, so a report
+# scans one row per branch and day rather than the raw records.
+
+
+def branch_summaries(manager, startDate, endDate):
+    return Daily_Branch_Summary.objects.filter(manager=manager
+                                      ).filter(date__range=[startDate, endDate])
+
+
+def expense_summaries(manager, startDate, endDate):
+    return Daily_Expense_Summary.objects.filter(summary__manager=manager
+                                       ).filter(summary__date__range=[startDate, endDate])
+
+
+def sales_by_branch_date(manager, startDate, endDate):
+    """ {(branch location, date): gross sales} """
+    rows = branch_summaries(manager, startDate, endDate
+                  ).filter(gross_sales__gt=0
+                  ).values_list('branch__location', 'date', 'gross_sales')
+    totals = {}
+    for location, date, total in rows:
+        totals[(location, date)] = totals.get((location, date), 0) + total
+    return totals
+
+
+def expenses_by_branch_type_date(manager, startDate, endDate):
+    """ {(branch location, expense type name, date): amount} """
+    rows = expense_summaries(manager, startDate, endDate
+                   ).values_list('summary__branch__location', 'type_of_expense__name', 'summary__date', 'amount')
+    totals = {}
+    for location, name, date, amount in rows:
+        totals[(location, name, date)] = totals.get((location, name, date), 0) + amount
+    return totals
+
+
+def expenses_by_type_branch(manager, startDate, endDate):
+    """ {(expense type name, branch location): amount} """
+    rows = expense_summaries(manager, startDate, endDate
+                   ).values_list('type_of_expense__name', 'summary__branch__location', 'amount')
+    totals = {}
+    for name, location, amount in rows:
+        totals[(name, location)] = totals.get((name, location), 0) + amount
+    return totals
+
+
+def purchases_by_branch_date(manager, startDate, endDate):
+    """ {(branch location, date): invoice worth} """
+    rows = branch_summaries(manager, startDate, endDate
+                  ).filter(purchases__gt=0
+                  ).values_list('branch__location', 'date', 'purchases')
+    totals = {}
+    for location, date, total in rows:
+        totals[(location, date)] = totals.get((location, date), 0) + total
+    return totals
+
+
+def payroll_by_branch(manager, startDate, endDate):
+    """
+    {branch location: regular + holiday + special holiday pay}. Staff
+    assigned to several branches count fully towards each of them.
+    """
+    rows = branch_summaries(manager, startDate, endDate
+                  ).filter(payroll__gt=0
+                  ).values_list('branch__location', 'payroll')
+    totals = {}
+    for location, total in rows:
+        totals[location] = totals.get(location, 0) + total
+    return totals
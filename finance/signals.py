@@ -0,0 +1,110 @@
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from adminApiModel.utils import invalidate_totals
+from finance import ledger, summary
+from finance.models import Sales, Expenses, Bank_Status
+from staff.models import Bimonthly_In, Roles
+from stock.models import Purchases
+
+
+@receiver(post_delete, sender=Bank_Status)
+def bank_status_deleted(sender, instance, **kwargs):
+    ledger.record_deleted(instance)
+
+
+@receiver(post_save, sender=Sales)
+@receiver(post_save, sender=Expenses)
+@receiver(post_save, sender=Purchases)
+@receiver(post_save, sender=Bimonthly_In)
+@receiver(post_save, sender=Bank_Status)
+@receiver(post_delete, sender=Sales)
+@receiver(post_delete, sender=Expenses)
+@receiver(post_delete, sender=Purchases)
+@receiver(post_delete, sender=Bimonthly_In)
+@receiver(post_delete, sender=Bank_Status)
+def totals_changed(sender, instance, **kwargs):
+    invalidate_totals(sender, instance.manager_id)
+
+
+# daily branch summaries
+
+SUMMARY_PARTS = {
+    Sales: summary.refresh_sales,
+    Expenses: summary.refresh_expenses,
+    Purchases: summary.refresh_purchases,
+}
+
+
+def summary_keys(sender, values):
+    if sender is Bimonthly_In:
+        return summary.payroll_keys(values['manager_id'], values['staff_id'], values['date'])
+    return [(values['manager_id'], values['branch_id'], values['date'])]
+
+
+def key_fields(sender):
+    if sender is Bimonthly_In:
+        return ('manager_id', 'staff_id', 'date')
+    return ('manager_id', 'branch_id', 'date')
+
+
+def refresh_part(sender):
+    if sender is Bimonthly_In:
+        return summary.refresh_payroll
+    return SUMMARY_PARTS[sender]
+
+
+@receiver(pre_save, sender=Sales)
+@receiver(pre_save, sender=Expenses)
+@receiver(pre_save, sender=Purchases)
+@receiver(pre_save, sender=Bimonthly_In)
+def remember_summary_keys(sender, instance, **kwargs):
+    # a save can move a record to another branch or date, in which case
+    # the row it used to count towards has to be refreshed as well
+    instance._previous_summary_keys = []
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).values(*key_fields(sender)).first()
+        if previous:
+            instance._previous_summary_keys = summary_keys(sender, previous)
+
+
+@receiver(post_save, sender=Sales)
+@receiver(post_save, sender=Expenses)
+@receiver(post_save, sender=Purchases)
+@receiver(post_save, sender=Bimonthly_In)
+def refresh_summary(sender, instance, **kwargs):
+    values = {f: getattr(instance, f) for f in key_fields(sender)}
+    keys = summary_keys(sender, values) + getattr(instance, '_previous_summary_keys', [])
+    summary.refresh(refresh_part(sender), keys)
+
+
+@receiver(post_delete, sender=Sales)
+@receiver(post_delete, sender=Expenses)
+@receiver(post_delete, sender=Purchases)
+@receiver(post_delete, sender=Bimonthly_In)
+def refresh_summary_after_delete(sender, instance, **kwargs):
+    values = {f: getattr(instance, f) for f in key_fields(sender)}
+    summary.refresh(refresh_part(sender), summary_keys(sender, values))
+
+
+@receiver(m2m_changed, sender=Roles.branches.through)
+def staff_branches_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # a staff's pay counts towards the branches they are assigned to, so
+    # the payroll of the branches they joined or left is recomputed
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_ids = set(instance.staffs.values_list('id', flat=True))
+        else:
+            instance._cleared_ids = set(instance.branches.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    changed = getattr(instance, '_cleared_ids', set()) if action == 'post_clear' else pk_set
+    if reverse:
+        staff_ids = Roles.objects.filter(id__in=changed).values_list('user_id', flat=True)
+        branch_ids = [instance.id]
+    else:
+        staff_ids = [instance.user_id]
+        branch_ids = changed
+    summary.refresh(summary.refresh_payroll, summary.staff_branch_keys(list(staff_ids), branch_ids))
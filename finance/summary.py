@@ -0,0 +1,156 @@
+from django.db import transaction
+from django.db.models import Sum, F
+
+from finance.models import Sales, Expenses, Daily_Branch_Summary, Daily_Expense_Summary
+from location.models import Branches
+from staff.models import Bimonthly_In
+from stock.models import Purchases
+
+
+# Daily_Branch_Summary rows are keyed by (manager id, branch id, date).
+# Every refresh_* function recomputes one part of one row from the raw
+# records, so a save only touches the rows and columns it can change.
+
+
+def store(key, values):
+    manager_id, branch_id, date = key
+    summary, _ = Daily_Branch_Summary.objects.update_or_create(
+        manager_id=manager_id, branch_id=branch_id, date=date, defaults=values)
+    return summary
+
+
+def refresh_sales(key):
+    manager_id, branch_id, date = key
+    totals = Sales.objects.filter(manager_id=manager_id
+                         ).filter(branch_id=branch_id
+                         ).filter(date=date
+                         ).filter(is_valid=True
+                         ).aggregate(gross_sales=Sum('gross_sales'),
+                                     cash_on_caja=Sum('cash_on_caja'),
+                                     cash_for_deposit=Sum('cash_for_deposit'))
+    store(key, {k: v or 0 for k, v in totals.items()})
+
+
+def refresh_expenses(key):
+    manager_id, branch_id, date = key
+    rows = Expenses.objects.filter(manager_id=manager_id
+                          ).filter(branch_id=branch_id
+                          ).filter(date=date
+                          ).filter(is_valid=True
+                          ).values('type_of_expense'
+                          ).annotate(total=Sum('amount'))
+    per_type = {row['type_of_expense']: row['total'] for row in rows}
+
+    summary = store(key, {'expenses': sum(per_type.values())})
+    summary.expense_types.all().delete()
+    Daily_Expense_Summary.objects.bulk_create([
+        Daily_Expense_Summary(summary=summary, type_of_expense_id=t, amount=amount)
+        for t, amount in per_type.items()
+    ])
+
+
+def refresh_purchases(key):
+    manager_id, branch_id, date = key
+    total = Purchases.objects.filter(manager_id=manager_id
+                             ).filter(branch_id=branch_id
+                             ).filter(date=date
+                             ).filter(is_valid=True
+                             ).aggregate(total=Sum('invoice_worth'))['total']
+    store(key, {'purchases': total or 0})
+
+
+def refresh_payroll(key):
+    manager_id, branch_id, date = key
+    total = Bimonthly_In.objects.filter(manager_id=manager_id
+                                ).filter(staff__roles__branches=branch_id
+                                ).filter(date=date
+                                ).aggregate(total=Sum(F('pay_reg') + F('pay_hd') + F('pay_shd')))['total']
+    store(key, {'payroll': total or 0})
+
+
+def payroll_keys(manager_id, staff_id, date):
+    # a staff's pay counts towards every branch they are assigned to
+    branch_ids = Branches.objects.filter(staffs__user_id=staff_id).values_list('id', flat=True)
+    return [(manager_id, branch_id, date) for branch_id in branch_ids]
+
+
+def staff_branch_keys(staff_ids, branch_ids):
+    """ Keys of every payroll day of the staff in the given branches """
+    days = Bimonthly_In.objects.filter(staff_id__in=staff_ids
+                              ).values_list('manager_id', 'date'
+                              ).distinct()
+    return [(manager_id, branch_id, date) for manager_id, date in days for branch_id in branch_ids]
+
+
+def refresh(refresh_part, keys):
+    with transaction.atomic():
+        for key in set(keys):
+            if None in key:
+                continue
+            refresh_part(key)
+
+
+def rebuild(startDate, endDate, manager_id=None):
+    """
+    Recompute every summary row between two dates from the raw records,
+    with one grouped query per source.
+    """
+    def scoped(queryset):
+        queryset = queryset.exclude(manager=None).filter(date__range=[startDate, endDate])
+        if manager_id:
+            queryset = queryset.filter(manager_id=manager_id)
+        return queryset
+
+    rows = {}
+    def row(key):
+        if key not in rows:
+            rows[key] = {'values': {}, 'expense_types': {}}
+        return rows[key]
+
+    for s in scoped(Sales.objects.filter(is_valid=True)
+            ).values('manager_id', 'branch_id', 'date'
+            ).annotate(gross_sales=Sum('gross_sales'),
+                       cash_on_caja=Sum('cash_on_caja'),
+                       cash_for_deposit=Sum('cash_for_deposit')):
+        values = row((s['manager_id'], s['branch_id'], s['date']))['values']
+        values['gross_sales'] = s['gross_sales']
+        values['cash_on_caja'] = s['cash_on_caja']
+        values['cash_for_deposit'] = s['cash_for_deposit']
+
+    for e in scoped(Expenses.objects.filter(is_valid=True)
+            ).values('manager_id', 'branch_id', 'date', 'type_of_expense'
+            ).annotate(total=Sum('amount')):
+        r = row((e['manager_id'], e['branch_id'], e['date']))
+        r['values']['expenses'] = r['values'].get('expenses', 0) + e['total']
+        r['expense_types'][e['type_of_expense']] = e['total']
+
+    for p in scoped(Purchases.objects.filter(is_valid=True)
+            ).values('manager_id', 'branch_id', 'date'
+            ).annotate(total=Sum('invoice_worth')):
+        row((p['manager_id'], p['branch_id'], p['date']))['values']['purchases'] = p['total'] or 0
+
+    for b in scoped(Bimonthly_In.objects.all()
+            ).values('manager_id', 'staff__roles__branches', 'date'
+            ).annotate(total=Sum(F('pay_reg') + F('pay_hd') + F('pay_shd'))):
+        if b['staff__roles__branches'] is None:
+            continue
+        row((b['manager_id'], b['staff__roles__branches'], b['date']))['values']['payroll'] = b['total']
+
+    with transaction.atomic():
+        scoped(Daily_Branch_Summary.objects.all()).delete()
+        summaries = [
+            Daily_Branch_Summary(manager_id=manager, branch_id=branch, date=date, **r['values'])
+            for (manager, branch, date), r in rows.items()
+        ]
+        Daily_Branch_Summary.objects.bulk_create(summaries, batch_size=500)
+
+        # bulk_create only sets primary keys on PostgreSQL, so look them up
+        ids = {}
+        for s in scoped(Daily_Branch_Summary.objects.all()).values('id', 'manager_id', 'branch_id', 'date'):
+            ids[(s['manager_id'], s['branch_id'], s['date'])] = s['id']
+        Daily_Expense_Summary.objects.bulk_create([
+            Daily_Expense_Summary(summary_id=ids[key], type_of_expense_id=t, amount=amount)
+            for key, r in rows.items()
+            for t, amount in r['expense_types'].items()
+        ], batch_size=500)
+    return len(summaries)
@@ -0,0 +1,171 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from finance import ledger
+from finance.models import Banks, Bank_Status, Sales, Expense_Types, Expense_Methods, Expenses, Daily_Branch_Summary
+from jobs import queue
+from jobs.models import Report_Job
+from location.models import Branches
+from staff.models import Roles, Bimonthly_In
+from stock.models import Purchases
+
+
+class MonthlyReportQueryCountTest(TestCase):
+
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', password='manager', is_staff=True)
+        self.manager.user_permissions.set(Permission.objects.all())
+        Roles.objects.create(user=self.manager, manager=self.manager, is_manager=True)
+        self.method = Expense_Methods.objects.create(manager=self.manager, name='Cash')
+        self.client.force_login(self.manager)
+
+    def add_data(self, num_branches, num_types, num_days, month):
+        branches = []
+        for b in range(num_branches):
+            branch = Branches.objects.create(manager=self.manager, location=str(month) + '-branch-' + str(b))
+            staff = get_user_model().objects.create(username=str(month) + '-staff-' + str(b))
+            roles = Roles.objects.create(user=staff, manager=self.manager, is_retailer=True)
+            roles.branches.add(branch)
+            Bimonthly_In.objects.create(staff=staff, manager=self.manager, date=datetime.date(2020, month, 8),
+                                        day='8', pay_reg=1000, pay_tot=1000)
+            branches.append(branch)
+        types = [Expense_Types.objects.create(manager=self.manager, name=str(month) + '-type-' + str(t))
+                 for t in range(num_types)]
+
+        for d in range(num_days):
+            date = datetime.date(2020, month, 1) + datetime.timedelta(days=d)
+            for branch in branches:
+                Sales(manager=self.manager, branch=branch, date=date, gross_sales=100,
+                      cash_on_caja=100, cash_for_deposit=100).save()
+                Purchases(manager=self.manager, branch=branch, date=date, is_paid=True,
+                          invoice_worth=50, delivered_worth=50, invoice_range='1-2').save()
+                for expense_type in types:
+                    Expenses.objects.create(manager=self.manager, branch=branch, type_of_expense=expense_type,
+                                            method_of_payment=self.method, date=date, amount=10)
+
+    def count_report_queries(self, month):
+        selected = Expenses.objects.filter(date__month=month).values_list('id', flat=True)
+        response = self.client.post('/finance/expenses/', {
+            'action': 'expense_monthly_report',
+            '_selected_action': list(selected),
+        })
+        self.assertRedirects(response, '/jobs/report_job/')
+
+        with CaptureQueriesContext(connection) as queries:
+            job = queue.run(queue.claim())
+        self.assertEqual(job.status, Report_Job.DONE)
+        self.addCleanup(job.file.delete, save=False)
+        self.assertTrue(job.file.read().startswith(b'%PDF'))
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.add_data(num_branches=1, num_types=1, num_days=3, month=1)
+        small = self.count_report_queries(1)
+
+        self.add_data(num_branches=4, num_types=6, num_days=31, month=3)
+        large = self.count_report_queries(3)
+
+        self.assertEqual(small, large)
+
+
+class ReportDownloadTest(TestCase):
+
+    def setUp(self):
+        self.manager = self.add_manager('manager')
+        self.other = self.add_manager('other')
+        branch = Branches.objects.create(manager=self.manager, location='Alpha')
+        date = datetime.date(2020, 1, 2)
+        Sales(manager=self.manager, branch=branch, date=date, gross_sales=100,
+              cash_on_caja=100, cash_for_deposit=100).save()
+        Purchases(manager=self.manager, branch=branch, date=date, is_paid=True,
+                  invoice_worth=50, delivered_worth=50, invoice_range='1-2').save()
+        Expenses.objects.create(manager=self.manager, branch=branch, date=date, amount=10,
+                                type_of_expense=Expense_Types.objects.create(manager=self.manager, name='Rent'),
+                                method_of_payment=Expense_Methods.objects.create(manager=self.manager, name='Cash'))
+        queue.enqueue(self.manager.id, self.manager, 'monthly', date='2020-01-01')
+        self.job = queue.run(queue.claim())
+        self.addCleanup(self.job.file.delete, save=False)
+
+    def add_manager(self, username):
+        manager = get_user_model().objects.create_user(username=username, is_staff=True)
+        manager.user_permissions.set(Permission.objects.all())
+        Roles.objects.create(user=manager, manager=manager, is_manager=True)
+        return manager
+
+    def test_manager_downloads_own_report(self):
+        self.client.force_login(self.manager)
+        response = self.client.get('/jobs/report_job/' + str(self.job.id) + '/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_other_manager_cannot_download(self):
+        self.client.force_login(self.other)
+        response = self.client.get('/jobs/report_job/' + str(self.job.id) + '/download/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_stored_name_is_not_guessable(self):
+        name = self.job.file.name.rsplit('/', 1)[-1]
+        self.assertNotEqual(name, 'monthly-' + str(self.job.id) + '.pdf')
+        self.assertTrue(name.startswith('monthly-' + str(self.job.id) + '-'))
+
+
+class PayrollSummaryReassignmentTest(TestCase):
+
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager')
+        Roles.objects.create(user=self.manager, manager=self.manager, is_manager=True)
+        self.alpha = Branches.objects.create(manager=self.manager, location='Alpha')
+        self.bravo = Branches.objects.create(manager=self.manager, location='Bravo')
+        staff = get_user_model().objects.create_user(username='staff')
+        self.roles = Roles.objects.create(user=staff, manager=self.manager, is_retailer=True)
+        self.roles.branches.add(self.alpha)
+        self.date = datetime.date(2020, 1, 8)
+        Bimonthly_In.objects.create(staff=staff, manager=self.manager, date=self.date, day='8',
+                                    pay_reg=1000, pay_tot=1000)
+
+    def payroll(self):
+        return dict(Daily_Branch_Summary.objects.filter(date=self.date).values_list('branch__location', 'payroll'))
+
+    def test_reassigned_staff(self):
+        self.assertEqual(self.payroll(), {'Alpha': 1000})
+        self.roles.branches.set([self.bravo])
+        self.assertEqual(self.payroll(), {'Alpha': 0, 'Bravo': 1000})
+
+    def test_cleared_branches(self):
+        self.roles.branches.clear()
+        self.assertEqual(self.payroll(), {'Alpha': 0})
+
+    def test_assigned_from_branch(self):
+        self.bravo.staffs.add(self.roles)
+        self.assertEqual(self.payroll(), {'Alpha': 1000, 'Bravo': 1000})
+        self.alpha.staffs.clear()
+        self.assertEqual(self.payroll(), {'Alpha': 0, 'Bravo': 1000})
+
+
+class PresentTotalInvalidationTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.manager = get_user_model().objects.create_user(username='manager')
+        self.bank = Banks.objects.create(manager=self.manager, name='BDO')
+        Bank_Status.objects.create(manager=self.manager, bank=self.bank, date=timezone.now(), update=100)
+
+    def test_total_is_invalidated_on_commit(self):
+        self.assertEqual(ledger.get_present_total(self.manager.id), 100)
+        with transaction.atomic():
+            status = Bank_Status.objects.create(manager=self.manager, bank=self.bank,
+                                                date=timezone.now(), deposit=50)
+            # other requests still see the old total until the commit
+            self.assertIsNotNone(cache.get(ledger.present_total_key(self.manager.id)))
+        self.assertEqual(ledger.get_present_total(self.manager.id), 150)
+        with transaction.atomic():
+            status.delete()
+            self.assertEqual(ledger.get_present_total(self.manager.id), 150)
+        self.assertEqual(ledger.get_present_total(self.manager.id), 100)
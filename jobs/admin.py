@@ -0,0 +1,80 @@
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from adminApiModel.scope import get_scope
+from jobs import queue
+from jobs.models import Report_Job
+
+
+def job_queued_response(model_admin, request, job):
+    """
+    Response of an admin action that queued a report: the report job list
+    when the job was accepted, otherwise back to the current list.
+    """
+    if job is None:
+        model_admin.message_user(request,
+            "There are already " + str(queue.MAX_PENDING_JOBS) + " reports waiting, "
+            "please try again once one of them is done.", messages.ERROR)
+        return None
+    model_admin.message_user(request, str(job) + " was queued and will be ready to download shortly.")
+    return redirect('admin:jobs_report_job_changelist')
+
+
+@admin.register(Report_Job)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'requested_by', 'created', 'finished', 'download')
+    list_filter = ('kind', 'status')
+    list_select_related = ('requested_by',)
+    fields = ('kind', 'params', 'status', 'requested_by', 'created', 'started', 'finished', 'download', 'error')
+    readonly_fields = fields
+    change_list_template = 'admin/jobs/change_list_report_job.html'
+
+
+    def download(self, obj):
+        if not obj.file:
+            return ""
+        return format_html('<a href="{}">Download</a>',
+                           reverse('admin:jobs_report_job_download', args=[obj.id]))
+
+    def get_urls(self):
+        return [
+            path('<int:job_id>/download/', self.admin_site.admin_view(self.download_view),
+                 name='jobs_report_job_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, job_id):
+        # reports hold payroll, so only the manager's own users with access
+        # to report jobs get them, never through a guessable media url
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        job = get_object_or_404(self.get_queryset(request), id=job_id)
+        if not job.file:
+            raise Http404
+        return FileResponse(job.file.open('rb'), as_attachment=True,
+                            filename=job.kind + "-" + str(job.id) + ".pdf",
+                            content_type='application/pdf')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+
+        if request.user.is_superuser:
+            return queryset
+        return queryset.filter(manager_id=get_scope(request).manager_id)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        my_context = {
+            'has_waiting_jobs': self.get_queryset(request).filter(
+                status__in=[Report_Job.PENDING, Report_Job.RUNNING]).exists(),
+        }
+        return super(ReportJobAdmin, self).changelist_view(request,
+            extra_context=my_context)
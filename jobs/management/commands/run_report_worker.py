@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs import queue
+
+
+class Command(BaseCommand):
+    help = 'Render queued PDF reports, polling the database for new jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='exit once the queue is empty')
+        parser.add_argument('--sleep', type=float, default=5, help='seconds to wait between polls')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            requeued = queue.requeue_stale()
+            if requeued:
+                self.stdout.write(str(requeued) + " stale jobs requeued")
+
+            job = queue.claim()
+            if job:
+                job = queue.run(job)
+                self.stdout.write(str(job) + ": " + job.get_status_display())
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
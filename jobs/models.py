@@ -0,0 +1,64 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+
+from private_storage.fields import PrivateFileField
+
+
+class Report_Job(models.Model):
+
+
+    def user_directory_path(instance, filename):
+        return str(instance.manager.id) + "/reports/" + \
+        instance.created.strftime("%Y/%m/") + filename
+
+    PENDING = 'PEN'
+    RUNNING = 'RUN'
+    DONE = 'DON'
+    FAILED = 'FAI'
+
+    manager = models.ForeignKey(get_user_model(),
+                                on_delete=models.CASCADE,
+                                related_name='report_jobs')
+    requested_by = models.ForeignKey(get_user_model(),
+                                on_delete=models.SET_NULL,
+                                related_name='requested_report_jobs',
+                                null=True,
+                                blank=True)
+    kind = models.CharField(
+        max_length=16,
+        choices=[
+            ('weekly', 'Weekly Report'),
+            ('monthly', 'Monthly Report'),
+            ('payslips', 'Pay Slips'),
+        ]
+    )
+    # JSON encoded arguments of the renderer
+    params = models.TextField(default='{}')
+    status = models.CharField(
+        max_length=3,
+        default=PENDING,
+        choices=[
+            (PENDING, 'Pending'),
+            (RUNNING, 'Running'),
+            (DONE, 'Done'),
+            (FAILED, 'Failed'),
+        ]
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    file = PrivateFileField(blank=True, null=True, upload_to=user_directory_path, max_file_size=15728640)
+    error = models.TextField(default='', blank=True)
+
+
+
+    class Meta:
+        verbose_name = "Report Job"
+        verbose_name_plural = "Report Jobs"
+        indexes = [
+            models.Index(fields=['status', 'created']),
+        ]
+
+
+    def __str__(self):
+        return self.get_kind_display() + " " + self.created.strftime("%B %d %Y %H:%M")
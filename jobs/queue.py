@@ -0,0 +1,69 @@
+import datetime, json, secrets, traceback
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from jobs import renderers
+from jobs.models import Report_Job
+
+
+# the number of pending or running jobs a manager may have at once
+MAX_PENDING_JOBS = 3
+
+# a running job not finished after this long is assumed to belong to a
+# worker that died, and is handed out again
+STALE_AFTER = datetime.timedelta(minutes=30)
+
+
+def enqueue(manager_id, user, kind, **params):
+    """
+    Queue a report of ``kind`` for the worker. Returns the job, or None
+    when the manager already has MAX_PENDING_JOBS waiting.
+    """
+    with transaction.atomic():
+        waiting = Report_Job.objects.filter(manager_id=manager_id
+                                   ).filter(status__in=[Report_Job.PENDING, Report_Job.RUNNING]
+                                   ).select_for_update()
+        if len(waiting) >= MAX_PENDING_JOBS:
+            return None
+        return Report_Job.objects.create(manager_id=manager_id, requested_by=user, kind=kind,
+                                         params=json.dumps(params, default=str))
+
+
+def claim():
+    """
+    Take the oldest pending job. The status is switched with a conditional
+    update, so two workers can never both run the same job.
+    """
+    pending = Report_Job.objects.filter(status=Report_Job.PENDING
+                               ).order_by('created', 'id'
+                               ).values_list('id', flat=True)
+    for job_id in pending[:10]:
+        claimed = Report_Job.objects.filter(id=job_id
+                                   ).filter(status=Report_Job.PENDING
+                                   ).update(status=Report_Job.RUNNING, started=timezone.now())
+        if claimed:
+            return Report_Job.objects.get(id=job_id)
+    return None
+
+
+def requeue_stale():
+    return Report_Job.objects.filter(status=Report_Job.RUNNING
+                            ).filter(started__lt=timezone.now() - STALE_AFTER
+                            ).update(status=Report_Job.PENDING, started=None)
+
+
+def run(job):
+    try:
+        content = renderers.RENDERERS[job.kind](job.manager_id, **json.loads(job.params))
+        # the random part keeps the stored file from being found by its url
+        name = job.kind + "-" + str(job.id) + "-" + secrets.token_urlsafe(16) + ".pdf"
+        job.file.save(name, ContentFile(content), save=False)
+        job.status = Report_Job.DONE
+    except Exception:
+        job.status = Report_Job.FAILED
+        job.error = traceback.format_exc()
+    job.finished = timezone.now()
+    job.save()
+    return job
@@ -0,0 +1,39 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+
+
+# Each renderer takes the manager id and the parameters the job was queued
+# with, and returns the PDF as bytes. The admin modules are imported
+# lazily since they import the job queue themselves.
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def weekly(manager_id, startDate, endDate):
+    from finance.admin import CustomExpenseAdmin
+
+    manager = get_user_model().objects.get(id=manager_id)
+    return CustomExpenseAdmin.renderWeeklyReport(manager, parse_date(startDate), parse_date(endDate))
+
+
+def monthly(manager_id, date):
+    from finance.admin import CustomExpenseAdmin
+
+    manager = get_user_model().objects.get(id=manager_id)
+    return CustomExpenseAdmin.renderMonthlyReport(manager, parse_date(date))
+
+
+def payslips(manager_id, ids):
+    from staff import payslips
+
+    return payslips.render(manager_id, ids)
+
+
+RENDERERS = {
+    'weekly': weekly,
+    'monthly': monthly,
+    'payslips': payslips,
+}
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from location import models
+from adminApiModel.scope import get_scope
 from adminApiModel.utils import FilterBranchStaffDropDown
 
 
@@ -9,14 +10,14 @@ class BranchAdmin(admin.ModelAdmin):
 
 
     def get_queryset(self, request):
-        user = request.user
+        scope = get_scope(request)
 
-        if user.is_superuser:
+        if scope.is_superuser:
             return super().get_queryset(request)
-        elif user.roles.is_manager:
-            return user.branches
-        elif user.roles.is_assistant:
-            return user.roles.manager.branches
+        elif scope.is_manager or scope.is_assistant:
+            return scope.manager_branches()
+        else:
+            return models.Branches.objects.filter(id__in=scope.branch_ids)
 
 
     def get_form(self, request, obj=None, **kwargs):
@@ -36,10 +37,7 @@ class BranchAdmin(admin.ModelAdmin):
         return form
 
     def save_model(self, request, obj, form, change):
-        if request.user.roles.is_manager:
-            obj.manager = request.user
-        else:
-            obj.manager = request.user.roles.manager
+        obj.manager = get_scope(request).manager
         super().save_model(request, obj, form, change)
 
 
@@ -66,14 +64,14 @@ class CurrentBranchAdmin(FilterBranchStaffDropDown):
         return form
 
     def get_queryset(self, request):
-        user = request.user
+        scope = get_scope(request)
 
-        if user.is_superuser:
+        if scope.is_superuser:
             return super().get_queryset(request)
-        elif user.roles.is_manager:
-            return user.staff_branches
+        elif scope.is_manager:
+            return scope.owned(models.Current_Branch)
         else:
-            return models.Current_Branch.objects.filter(user=user)
+            return models.Current_Branch.objects.filter(user=request.user)
 
 
     def get_form(self, request, obj=None, **kwargs):
@@ -94,8 +92,5 @@ class CurrentBranchAdmin(FilterBranchStaffDropDown):
 
 
     def save_model(self, request, obj, form, change):
-        if request.user.roles.is_manager:
-            obj.manager = request.user
-        else:
-            obj.manager = request.user.roles.manager
+        obj.manager = get_scope(request).manager
         super().save_model(request, obj, form, change)
\ No newline at end of file
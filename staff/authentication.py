@@ -0,0 +1,129 @@
+import copy, hashlib, threading, time
+
+from django.conf import settings
+from django.utils import timezone
+
+from knox.auth import TokenAuthentication
+from knox.models import AuthToken
+
+from location.models import Current_Branch
+from staff.models import Roles
+
+
+# most tokens kept at once, past which the cache is emptied
+MAX_CACHED_TOKENS = 10000
+
+
+# Every POS request authenticates its knox token, which takes a lookup of
+# the token, a hash, a check of the user's other tokens and then loading
+# the user, its roles and its current branch. CachedTokenAuthentication
+# keeps what a verified token resolved to for AUTH_TOKEN_CACHE_TTL seconds
+# in the memory of the process, so repeated calls skip all of that. An
+# entry is dropped when its token is deleted or expires, when its user
+# logs out and when the user, its roles or its current branch are saved.
+# Other processes only notice a logout once their entry runs out, which is
+# why the TTL is kept short.
+
+
+class CachedToken:
+    """
+    The token of an authenticated request, with the manager and current
+    branch of its user. Set as request.auth.
+    """
+
+    def __init__(self, key, digest, user, manager_id, branch_id, expiry):
+        self.key = key
+        self.digest = digest
+        self.user = user
+        self.manager_id = manager_id
+        self.branch_id = branch_id
+        self.expiry = expiry
+        self.cached_until = time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL
+
+    def is_expired(self):
+        if self.expiry is not None and self.expiry < timezone.now():
+            return True
+        return self.cached_until < time.monotonic()
+
+    def delete(self):
+        """ Log the token out, as knox's LogoutView does with request.auth """
+        evict(self.key)
+        AuthToken.objects.filter(digest=self.digest).delete()
+
+
+_tokens = {}
+_lock = threading.Lock()
+
+
+def token_key(token):
+    # the token itself is not kept in memory
+    return hashlib.sha256(token).hexdigest()
+
+
+def get_cached(key):
+    cached = _tokens.get(key)
+    if cached is not None and cached.is_expired():
+        evict(key)
+        return None
+    return cached
+
+
+def store(cached):
+    with _lock:
+        if len(_tokens) >= MAX_CACHED_TOKENS:
+            for key in [k for k, c in _tokens.items() if c.is_expired()]:
+                del _tokens[key]
+            if len(_tokens) >= MAX_CACHED_TOKENS:
+                _tokens.clear()
+        _tokens[cached.key] = cached
+
+
+def evict(key):
+    with _lock:
+        _tokens.pop(key, None)
+
+
+def evict_digest(digest):
+    with _lock:
+        for key in [k for k, c in _tokens.items() if c.digest == digest]:
+            del _tokens[key]
+
+
+def evict_user(user_id):
+    with _lock:
+        for key in [k for k, c in _tokens.items() if c.user.id == user_id]:
+            del _tokens[key]
+
+
+def fresh_user(user):
+    """ A copy of ``user`` sharing no cached relations with it """
+    copied = copy.copy(user)
+    copied._state = copy.copy(user._state)
+    copied._state.fields_cache = {}
+    copied.__dict__.pop('_prefetched_objects_cache', None)
+    return copied
+
+
+def clear():
+    with _lock:
+        _tokens.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    knox's TokenAuthentication, remembering verified tokens for a short
+    while. request.auth is a CachedToken.
+    """
+
+    def authenticate_credentials(self, token):
+        key = token_key(token)
+        cached = get_cached(key)
+        if cached is None:
+            user, auth_token = super().authenticate_credentials(token)
+            manager_id = Roles.objects.filter(user_id=user.id).values_list('manager_id', flat=True).first()
+            branch_id = Current_Branch.objects.filter(user_id=user.id).values_list('branch_id', flat=True).first()
+            cached = CachedToken(key, auth_token.digest, fresh_user(user), manager_id, branch_id, auth_token.expiry)
+            store(cached)
+        # each request gets its own user, so what one request caches on it
+        # is not seen by the next
+        return (fresh_user(cached.user), cached)
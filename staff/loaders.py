@@ -0,0 +1,79 @@
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from django.db.models import Prefetch
+
+from .models import Bimonthly_In, Government_Benefits, Loans
+
+
+# Loaders read everything a payroll document needs for many records in a
+# fixed number of queries and hand back plain dataclasses, which can be
+# passed to other processes and used without touching the database again.
+
+
+@dataclass
+class LoanLine:
+    loan_type: str
+    mnth_pay: float
+
+
+@dataclass
+class BenefitLine:
+    institute: str
+    staff_cont: float
+    mngr_cont: float
+    loans: List[LoanLine] = field(default_factory=list)
+
+
+@dataclass
+class Payslip:
+    id: int
+    staff_name: str
+    company: str
+    # the Bimonthly_In columns, by attribute name
+    values: Dict[str, object]
+    benefits: List[BenefitLine] = field(default_factory=list)
+
+
+def active_loans():
+    return Loans.objects.filter(is_paid=False).filter(is_valid=True)
+
+
+def benefits_prefetch(lookup='staff__government_benefits'):
+    """
+    Prefetch of the government benefits at ``lookup``, each with its unpaid,
+    valid loans in ``active_loans``.
+    """
+    benefits = Government_Benefits.objects.prefetch_related(
+        Prefetch('loans', queryset=active_loans(), to_attr='active_loans'))
+    return Prefetch(lookup, queryset=benefits)
+
+
+def load_payslips(manager_id, ids):
+    """
+    Return a Payslip for each of the manager's Bimonthly_In ``ids``, in the
+    order given, with three queries whatever the number of records.
+    """
+    bimonthlies = Bimonthly_In.objects.filter(manager_id=manager_id
+                                     ).filter(id__in=ids
+                                     ).select_related('staff__roles__company'
+                                     ).prefetch_related(benefits_prefetch()
+                                     ).in_bulk()
+
+    payslips = []
+    for i in ids:
+        bimonthly_in = bimonthlies.get(i)
+        if bimonthly_in is None:
+            continue
+        payslips.append(Payslip(
+            id=bimonthly_in.id,
+            staff_name=str(bimonthly_in.staff),
+            company=str(bimonthly_in.staff.roles.company),
+            values={f.attname: getattr(bimonthly_in, f.attname) for f in Bimonthly_In._meta.concrete_fields},
+            benefits=[
+                BenefitLine(institute=gb.institute, staff_cont=gb.staff_cont, mngr_cont=gb.mngr_cont,
+                            loans=[LoanLine(loan.loan_type, loan.mnth_pay) for loan in gb.active_loans])
+                for gb in bimonthly_in.staff.government_benefits.all()
+            ],
+        ))
+    return payslips
@@ -109,12 +109,18 @@ class Hours_In(models.Model):
                         'staff'],
                 name='unique hours in'),
         ]
+        indexes = [
+            # payroll periods of a staff
+            models.Index(fields=['staff', 'date'], name='hours_in_staff_date'),
+            # the manager's recent attendance in the admin
+            models.Index(fields=['manager', 'date'], name='hours_in_manager_date'),
+        ]
 
 
     def __str__(self):
         return str(self.staff) + " " + str(self.date)
 
-    def get_dailies(staff, day, date):
+    def get_period(day, date):
         if day == '8':
             up_limit = date.replace(day=6)
 
@@ -125,7 +131,10 @@ class Hours_In(models.Model):
             up_limit = date.replace(day=21)
             low_limit = date.replace(day=7)
 
+        return low_limit, up_limit
 
+    def get_dailies(staff, day, date):
+        low_limit, up_limit = Hours_In.get_period(day, date)
         return Hours_In.objects.filter(staff=staff).filter(date__gte=low_limit).filter(date__lte=up_limit)
 
 
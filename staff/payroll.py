@@ -0,0 +1,315 @@
+from datetime import datetime, date, timedelta
+from dateutil.relativedelta import relativedelta
+
+import numpy as np
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum, Count, Q, Prefetch
+
+from adminApiModel.utils import invalidate_totals
+from finance import summary
+from location.models import Branches
+from .loaders import active_loans
+from .models import Roles, Hours_In, Bimonthly_In, Government_Benefits, Loans
+
+
+DAY_TYPES = ['REG', 'HD', 'SHD', 'VL', 'SL', 'SPL']
+
+# government contributions are deducted in this order
+INSTITUTES = [('SSS', 'pay_sss'), ('PI', 'pay_pi'), ('PH', 'pay_ph')]
+
+# carried over from one period's Bimonthly_In to the next
+CARRIED_FIELDS = ['bene_a', 'bene_a_desc', 'bene_b', 'bene_b_desc',
+                  'bene_c', 'bene_c_desc', 'bene_d', 'bene_d_desc',
+                  'ded_a', 'ded_a_desc', 'ded_b', 'ded_b_desc',
+                  'ded_c', 'ded_c_desc', 'ded_d', 'ded_d_desc']
+
+
+def empty_hours():
+    return {day_type: {'hours': 0, 'overtime': 0, 'days': 0, 'zero_days': 0} for day_type in DAY_TYPES}
+
+
+def hours_totals(row):
+    return {
+        'hours': row['total_hours'] or 0,
+        'overtime': row['total_overtime'] or 0,
+        'days': row['num_days'],
+        'zero_days': row['num_zero_days'],
+    }
+
+
+def grouped_hours(hours_in, *fields):
+    return hours_in.order_by(
+                  ).values(*fields
+                  ).annotate(total_hours=Sum('hours'),
+                             total_overtime=Sum('overtime_hours'),
+                             num_days=Count('id'),
+                             num_zero_days=Count('id', filter=Q(hours=0)))
+
+
+def hours_by_day_type(hours_in):
+    """
+    {day type: {'hours', 'overtime', 'days', 'zero_days'}} of an Hours_In
+    queryset, in one grouped query. Day types without entries are zeros.
+    """
+    totals = empty_hours()
+    for row in grouped_hours(hours_in, 'day_type'):
+        totals[row['day_type']] = hours_totals(row)
+    return totals
+
+
+def hours_by_staff_day_type(hours_in):
+    """ {staff id: hours_by_day_type} of an Hours_In queryset, in one query """
+    totals = {}
+    for row in grouped_hours(hours_in, 'staff', 'day_type'):
+        if row['staff'] not in totals:
+            totals[row['staff']] = empty_hours()
+        totals[row['staff']][row['day_type']] = hours_totals(row)
+    return totals
+
+
+def stack_hours(staff_hours):
+    """
+    Turn a list of hours_by_day_type results into
+    {day type: {'hours', 'overtime', 'days', 'zero_days': array}}, with one
+    element per staff.
+    """
+    return {
+        day_type: {
+            key: np.array([hours[day_type][key] for hours in staff_hours], dtype=float)
+            for key in ['hours', 'overtime', 'days', 'zero_days']
+        }
+        for day_type in DAY_TYPES
+    }
+
+
+def as_matrix(rows):
+    """ 2d float array of ``rows``, blanks counting as 0 """
+    return np.array([[v or 0 for v in row] for row in rows], dtype=float).reshape(len(rows), -1)
+
+
+def compute_pay_arrays(hours, hrly_rate, hrly_allow, benefits, deductions):
+    """
+    Pay columns of many Bimonthly_In at once, before government
+    contributions and loans. ``hours`` comes from stack_hours, the rates are
+    arrays with one element per staff and ``benefits`` and ``deductions``
+    are as_matrix arrays with a row per staff. Returns {column: array}.
+    Overtime pay is shown on the pay slip but not part of the total.
+    """
+    pay = {}
+    pay_tot = np.zeros(len(hrly_rate))
+    reg, hd, shd = hours['REG'], hours['HD'], hours['SHD']
+
+    pay['hrs_reg'] = reg['hours']
+    pay['hrs_reg_over'] = reg['overtime']
+    pay['pay_reg'] = pay['hrs_reg'] * hrly_rate
+    pay['pay_reg_over'] = pay['hrs_reg_over'] * hrly_rate * 1.25
+    pay_tot += pay['pay_reg']
+
+    # holidays not worked are paid 8 hours
+    pay['hrs_hd'] = hd['hours']
+    pay['hrs_hd_over'] = hd['overtime']
+    pay['pay_hd'] = pay['hrs_hd'] * hrly_rate * 2 + hrly_rate * 8 * hd['zero_days']
+    pay['pay_hd_over'] = pay['hrs_hd_over'] * hrly_rate * 2 * 1.3
+    pay_tot += pay['pay_hd']
+
+    pay['hrs_shd'] = shd['hours']
+    pay['hrs_shd_over'] = shd['overtime']
+    pay['pay_shd'] = pay['hrs_shd'] * hrly_rate * 1.3
+    pay['pay_shd_over'] = pay['hrs_shd_over'] * hrly_rate * 1.69
+    pay_tot += pay['pay_shd']
+
+    # leaves are paid 8 hours a day
+    for day_type in ['VL', 'SL', 'SPL']:
+        hrs = hours[day_type]['days'] * 8
+        pay['hrs_' + day_type.lower()] = hrs
+        pay['pay_' + day_type.lower()] = hrs * hrly_rate
+        pay_tot += pay['pay_' + day_type.lower()]
+
+    pay['extr_alw'] = hrly_allow * pay['hrs_reg']
+    pay['extr_alw'] += pay['hrs_hd'] * hrly_allow
+    pay['extr_alw'] += pay['hrs_shd'] * hrly_allow
+    pay_tot += pay['extr_alw']
+
+    for b in benefits.T:
+        pay_tot += b
+    for d in deductions.T:
+        pay_tot -= d
+
+    pay['pay_tot'] = pay_tot
+    return pay
+
+
+def check_rates(roles):
+    """
+    Raise a ValidationError naming the staff whose hourly rate or
+    allowance was never set, which would make their pay NaN.
+    """
+    for r in roles:
+        if r.hrly_rate is None or r.hrly_allow is None:
+            raise ValidationError("Set the hourly rate and allowance of " + str(r.user) + " before computing their pay.")
+
+
+def compute_pays(staff_hours, hrly_rates, hrly_allows, benefits, deductions):
+    """
+    compute_pay_arrays over plain lists, with one element per staff.
+    Returns a {column: value} dict per staff.
+    """
+    pay = compute_pay_arrays(stack_hours(staff_hours),
+                             np.array(hrly_rates, dtype=float),
+                             np.array(hrly_allows, dtype=float),
+                             as_matrix(benefits),
+                             as_matrix(deductions))
+    columns = {column: values.tolist() for column, values in pay.items()}
+    return [{column: values[i] for column, values in columns.items()} for i in range(len(staff_hours))]
+
+
+def compute_pay(hours, hrly_rate, hrly_allow, benefits, deductions):
+    """ Pay columns of a single Bimonthly_In, see compute_pay_arrays """
+    return compute_pays([hours], [hrly_rate], [hrly_allow], [benefits], [deductions])[0]
+
+
+def deduct_government(pay_tot, benefits, institutes):
+    """
+    Deduct the staff contribution and the monthly loan payments of each of
+    ``institutes`` from ``pay_tot``. ``benefits`` maps an institute to its
+    Government_Benefits, with the unpaid loans in ``active_loans``. Returns
+    the new total and the loans that were paid.
+    """
+    paid = []
+    for institute in institutes:
+        if institute not in benefits:
+            raise RuntimeError("Staff has no " + institute + " government benefits")
+        gov_ben = benefits[institute]
+        pay_tot -= gov_ben.staff_cont
+        for loan in gov_ben.active_loans:
+            pay_tot -= loan.mnth_pay
+            paid.append(loan)
+    return pay_tot, paid
+
+
+def get_benefits(staff_id):
+    benefits = Government_Benefits.objects.filter(staff_id=staff_id
+                                         ).prefetch_related(Prefetch('loans', queryset=active_loans(), to_attr='active_loans'))
+    return {gb.institute: gb for gb in benefits}
+
+
+def compute_bimonthly(obj, pay_loans):
+    """
+    Fill in the hours and pay of ``obj`` from its staff's Hours_In. The
+    loans paid this period get their total_paid increased when
+    ``pay_loans`` is set.
+    """
+    roles = Roles.objects.select_related('user').get(user_id=obj.staff_id)
+    check_rates([roles])
+    hours = hours_by_day_type(Hours_In.get_dailies(obj.staff_id, obj.day, obj.date))
+
+    pay = compute_pay(hours, roles.hrly_rate, roles.hrly_allow,
+                      [obj.bene_a, obj.bene_b, obj.bene_c, obj.bene_d],
+                      [obj.ded_a, obj.ded_b, obj.ded_c, obj.ded_d])
+    for column, value in pay.items():
+        setattr(obj, column, value)
+
+    institutes = [institute for institute, flag in INSTITUTES if getattr(obj, flag)]
+    if institutes:
+        obj.pay_tot, paid = deduct_government(obj.pay_tot, get_benefits(obj.staff_id), institutes)
+        if pay_loans:
+            for loan in paid:
+                loan.total_paid += loan.mnth_pay
+                loan.save()
+
+
+def next_period(bi):
+    """ (date, day, pays government contributions) of the period after ``bi`` """
+    if bi.date.day == 8:
+        return date(bi.date.year, bi.date.month, 23), '23', False
+    return date(bi.date.year, bi.date.month, 8) + relativedelta(months=+1), '8', True
+
+
+def run_cycle(bimonthlies):
+    """
+    Create the next period's Bimonthly_In after each of ``bimonthlies``,
+    carrying over their benefits and deductions. The hours, rates, benefits
+    and loans of every staff are read with a fixed number of queries, the
+    pay is computed in memory and the records and loan payments are written
+    in bulk in one transaction. Returns the created records.
+    """
+    entries = []
+    for bi in bimonthlies:
+        new_date, day, pay_gov = next_period(bi)
+        obj = Bimonthly_In(staff_id=bi.staff_id, manager_id=bi.manager_id, date=new_date, day=day,
+                           pay_sss=pay_gov, pay_pi=pay_gov, pay_ph=pay_gov,
+                           **{f: getattr(bi, f) for f in CARRIED_FIELDS})
+
+        if obj.date < (datetime.today() - timedelta(days=20)).date():
+            raise RuntimeError("Cannot edit due to date. You cannot edit if it has been entered for more than 20 days.")
+        elif obj.date > (datetime.today() + timedelta(days=10)).date():
+            raise RuntimeError("Cannot edit due to date. Please automate entries only when the payroll is within 10 days away.")
+        entries.append(obj)
+
+    if not entries:
+        return []
+
+    staff_ids = {obj.staff_id for obj in entries}
+    roles = {r.user_id: r for r in Roles.objects.select_related('user').filter(user_id__in=staff_ids)}
+    check_rates(roles.values())
+
+    # one query per period, and a cycle normally has a single one
+    hours = {}
+    for day, period_date in {(obj.day, obj.date) for obj in entries}:
+        low_limit, up_limit = Hours_In.get_period(day, period_date)
+        hours[(day, period_date)] = hours_by_staff_day_type(
+            Hours_In.objects.filter(staff__in=staff_ids).filter(date__gte=low_limit).filter(date__lte=up_limit))
+
+    benefits = {}
+    for gb in Government_Benefits.objects.filter(staff_id__in=staff_ids
+                                        ).prefetch_related(Prefetch('loans', queryset=active_loans(), to_attr='active_loans')):
+        benefits.setdefault(gb.staff_id, {})[gb.institute] = gb
+
+    for obj in entries:
+        if obj.staff_id not in roles:
+            raise RuntimeError("Staff " + str(obj.staff_id) + " has no roles")
+
+    pays = compute_pays([hours[(obj.day, obj.date)].get(obj.staff_id, empty_hours()) for obj in entries],
+                        [roles[obj.staff_id].hrly_rate for obj in entries],
+                        [roles[obj.staff_id].hrly_allow for obj in entries],
+                        [[obj.bene_a, obj.bene_b, obj.bene_c, obj.bene_d] for obj in entries],
+                        [[obj.ded_a, obj.ded_b, obj.ded_c, obj.ded_d] for obj in entries])
+
+    paid = {}
+    for obj, pay in zip(entries, pays):
+        for column, value in pay.items():
+            setattr(obj, column, value)
+
+        institutes = [institute for institute, flag in INSTITUTES if getattr(obj, flag)]
+        if institutes:
+            obj.pay_tot, loans = deduct_government(obj.pay_tot, benefits.get(obj.staff_id, {}), institutes)
+            for loan in loans:
+                loan.total_paid += loan.mnth_pay
+                paid[loan.id] = loan
+
+    with transaction.atomic():
+        Bimonthly_In.objects.bulk_create(entries, batch_size=500)
+        Loans.objects.bulk_update(list(paid.values()), ['total_paid'], batch_size=500)
+        bulk_created(entries)
+    return entries
+
+
+def bulk_created(entries):
+    """
+    Do what the post_save signals would have done for Bimonthly_In records
+    written with bulk_create.
+    """
+    managers = {obj.manager_id for obj in entries}
+    for manager_id in managers:
+        invalidate_totals(Bimonthly_In, manager_id)
+
+    staff_branches = {}
+    for staff_id, branch_id in Branches.objects.filter(staffs__user_id__in={obj.staff_id for obj in entries}
+                                              ).values_list('staffs__user_id', 'id'):
+        staff_branches.setdefault(staff_id, []).append(branch_id)
+    keys = [(obj.manager_id, branch_id, obj.date)
+            for obj in entries
+            for branch_id in staff_branches.get(obj.staff_id, [])]
+    summary.refresh(summary.refresh_payroll, keys)
@@ -0,0 +1,248 @@
+import logging, math, os, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+from django.db import connections
+
+from PyPDF2 import PdfFileMerger
+from reportlab.pdfgen import canvas
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import Table, TableStyle
+
+from .loaders import load_payslips
+
+
+logger = logging.getLogger(__name__)
+
+# number of processes the pay slips are rendered with
+PAYSLIP_WORKERS = min(4, os.cpu_count() or 1)
+
+# below this many pay slips a process pool costs more than it saves
+MIN_PARALLEL_PAYSLIPS = 20
+
+
+# Pay slips are rendered in two steps. load_payslips() reads everything a
+# pay slip shows with a fixed number of queries, then the pay slips are
+# split in chunks that are drawn by separate processes and merged back into
+# a single PDF. Two pay slips share a page, so chunks always hold an even
+# number of them to keep the page breaks where they were.
+
+
+def render(manager_id, ids):
+    """
+    Render the pay slips of the manager's Bimonthly_In ``ids`` into a
+    single PDF.
+    """
+    started = time.perf_counter()
+    payslips = load_payslips(manager_id, ids)
+    loaded = time.perf_counter()
+
+    chunks = split(payslips, PAYSLIP_WORKERS)
+    if len(chunks) > 1:
+        # forked processes must not share the parent's database connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            results = list(executor.map(render_chunk, chunks))
+        pdf = merge([chunk_pdf for chunk_pdf, _ in results])
+    else:
+        results = [render_chunk(payslips)]
+        pdf = results[0][0]
+
+    for _, timings in results:
+        for staff_name, seconds in timings:
+            logger.debug("pay slip of %s rendered in %.4fs", staff_name, seconds)
+    finished = time.perf_counter()
+    logger.info("%d pay slips in %d chunks: loaded in %.3fs, rendered in %.3fs (%.4fs per staff)",
+                len(payslips), len(chunks), loaded - started, finished - loaded,
+                (finished - loaded) / max(len(payslips), 1))
+    return pdf
+
+
+def split(payslips, workers):
+    if len(payslips) < MIN_PARALLEL_PAYSLIPS or workers < 2:
+        return [payslips]
+    size = math.ceil(len(payslips) / workers)
+    size += size % 2
+    return [payslips[i:i + size] for i in range(0, len(payslips), size)]
+
+
+def merge(pdfs):
+    merger = PdfFileMerger()
+    for pdf in pdfs:
+        merger.append(BytesIO(pdf))
+    buffer = BytesIO()
+    merger.write(buffer)
+    merger.close()
+    return buffer.getvalue()
+
+
+def render_chunk(payslips):
+    """
+    Draw ``payslips`` two to a page. Returns the PDF and the time spent on
+    each pay slip.
+    """
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer)
+    p.setPageSize(A4)
+
+    timings = []
+    nextPage = False
+    for payslip in payslips:
+        started = time.perf_counter()
+        draw(p, payslip, nextPage)
+        if nextPage:
+            p.showPage()
+            nextPage = False
+        else:
+            nextPage = True
+            p.drawString(0, 410, "---------------------------------------------------------------------------------------------------------------------------")
+        timings.append((payslip.staff_name, time.perf_counter() - started))
+
+    p.save()
+
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf, timings
+
+
+def draw(p, payslip, nextPage):
+    b = payslip.values
+    if nextPage:
+        loc = 80
+        top_loc = 400
+    else:
+        p.setFont('Times-Bold', 8)
+        loc = 500
+        top_loc = 820
+
+    year = b['date'].year
+    month = b['date'].month
+    if b['day'] == "8":
+        if month != 1:
+            date_str = datetime(year, month-1, 22)
+        else:
+            date_str = datetime(year-1, 12, 22)
+        date_end = datetime(year, month, 6)
+    else:
+        date_str = datetime(year, month, 7)
+        date_end = datetime(year, month, 21)
+    date = date_str.strftime("%B %d %Y") + " - " + date_end.strftime("%B %d %Y")
+
+    p.drawString(10, top_loc, payslip.staff_name + " | " + "Pay Slip " + date + " | " + payslip.company)
+
+    data_in = [
+        ["Payment", "Amt", "Days", "Deduct", "Stf Cnt", "Mngt Cnt", "Alrdy Given", "Amt"],
+    ]
+
+    #  Payment
+    total_in = [0]
+    spaces_in = [0]
+    add_not_null_zero(data_in, "Regular Pay", b['pay_reg'], total_in, spaces_in=spaces_in, hours=b['hrs_reg'])
+    add_not_null_zero(data_in, "OT Reg: " + str(b['hrs_reg_over']), b['pay_reg_over'], total_in, spaces_in=spaces_in, hours=0)
+    add_not_null_zero(data_in, "Holiday Pay", b['pay_hd'], total_in, spaces_in=spaces_in, hours=b['hrs_hd'])
+    add_not_null_zero(data_in, "OT Holiday: " + str(b['hrs_hd_over']), b['pay_hd_over'], total_in, spaces_in=spaces_in, hours=0)
+    add_not_null_zero(data_in, "Special Holiday Pay", b['pay_shd'], total_in, spaces_in=spaces_in, hours=b['hrs_shd'])
+    add_not_null_zero(data_in, "OT Special Holiday: " + str(b['hrs_shd_over']), b['pay_shd_over'], total_in, spaces_in=spaces_in, hours=0)
+    add_not_null_zero(data_in, "Extra Allowance", b['extr_alw'], total_in, spaces_in=spaces_in)
+    add_not_null_zero(data_in, "Vacation Leave", b['pay_vl'], total_in, spaces_in=spaces_in, hours=b['hrs_vl'])
+    add_not_null_zero(data_in, "Sick Leave", b['pay_sl'], total_in, spaces_in=spaces_in, hours=b['hrs_sl'])
+    add_not_null_zero(data_in, "Single Parent Leave", b['pay_spl'], total_in, spaces_in=spaces_in, hours=b['hrs_spl'])
+    add_not_null_zero(data_in, b['bene_a_desc'], b['bene_a'], total_in, spaces_in=spaces_in)
+    add_not_null_zero(data_in, b['bene_b_desc'], b['bene_b'], total_in, spaces_in=spaces_in)
+    add_not_null_zero(data_in, b['bene_c_desc'], b['bene_c'], total_in, spaces_in=spaces_in)
+    add_not_null_zero(data_in, b['bene_d_desc'], b['bene_d'], total_in, spaces_in=spaces_in)
+    for i in range(spaces_in[0] + 1):
+        data_in.append(["", ""])
+    if total_in[0] != 0:
+        add_not_null_zero(data_in, "Total Pay:", 0, total_in, spaces_in=spaces_in, is_total=True)
+    else:
+        data_in.append(["", ""])
+
+    # Deduction
+    total_out = [0]
+    cur_row = [1]
+    add_not_null_zero(data_in, b['ded_a_desc'], b['ded_a'], total_out, i=cur_row, pay=False)
+    add_not_null_zero(data_in, b['ded_b_desc'], b['ded_b'], total_out, i=cur_row, pay=False)
+    add_not_null_zero(data_in, b['ded_c_desc'], b['ded_c'], total_out, i=cur_row, pay=False)
+    add_not_null_zero(data_in, b['ded_d_desc'], b['ded_d'], total_out, i=cur_row, pay=False)
+    for gb in payslip.benefits:
+        institute = gb.institute
+        if institute == "SSS" and not b['pay_sss']:
+            continue
+        elif institute == "PH" and not b['pay_ph']:
+            continue
+        elif institute == "PI" and not b['pay_pi']:
+            continue
+        add_not_null_zero(data_in, institute, gb.staff_cont, total_out, i=cur_row, pay=False, v_mngr=gb.mngr_cont)
+        for loan in gb.loans:
+            add_not_null_zero(data_in, institute + " " + loan.loan_type, loan.mnth_pay, total_out, i=cur_row, pay=False)
+
+    add_not_null_zero(data_in, "Total Deduct:", 0, total_out, i=[12], pay=False, is_total=True)
+
+    # Already Given Benefits
+    total_giv = [0]
+    cur_row = [1]
+    add_not_null_zero(data_in, b['giv_a_desc'], b['giv_a'], total_giv, i=cur_row, pay=False, is_giv=True)
+    add_not_null_zero(data_in, b['giv_b_desc'], b['giv_b'], total_giv, i=cur_row, pay=False, is_giv=True)
+    add_not_null_zero(data_in, b['giv_c_desc'], b['giv_c'], total_giv, i=cur_row, pay=False, is_giv=True)
+    add_not_null_zero(data_in, b['giv_d_desc'], b['giv_d'], total_giv, i=cur_row, pay=False, is_giv=True)
+
+    add_not_null_zero(data_in, "Total Alrdy Gvn:", 0, total_giv, i=[12], pay=False, is_total=True, is_giv=True)
+
+
+    table = Table(data_in)
+    width, height = A4
+    table.setStyle(TableStyle(
+        [
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
+            ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
+        ]
+    ))
+    table.wrapOn(p, width, height)
+    table.drawOn(p, 10, loc)
+
+    p.drawString(40, loc - 30, "Total Salary: " + str(total_in[0] - total_out[0]))
+    p.drawString(40, loc - 65, "_________________________________________________")
+    p.drawString(40, loc - 80, "           Printed Name over Signature           ")
+
+
+def add_not_null_zero(l, caption, v, t, i=0.1, spaces_in=0.1, pay=True, is_total=False, v_mngr="", is_giv=False, hours=0):
+    if not v:
+        if not is_total:
+            if pay:
+                spaces_in[0] += 1
+            return None
+    if i != 0.1:
+        if is_total:
+            v = t[0]
+        else:
+            t[0] += v
+        if not v:
+            return None
+        if is_giv:
+            if len(l[i[0]]) == 3:
+                l[i[0]].append('')
+                l[i[0]].append('')
+                l[i[0]].append('')
+                l[i[0]].append('')
+            elif len(l[i[0]]) == 0:
+                l[i[0]].append(['', '', '', '', '', ''])
+            l[i[0]].append(caption)
+            l[i[0]].append(round(v,2))
+            i[0] += 1
+        else:
+            if len(l[i[0]]) == 2:
+                l[i[0]].append('')
+            l[i[0]].append(caption)
+            l[i[0]].append(round(v,2))
+            l[i[0]].append(v_mngr)
+            i[0] += 1
+    else:
+        if is_total:
+            v = t[0]
+        else:
+            t[0] += v
+        l.append([caption, round(v,2), hours/8])
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model, user_logged_out
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from knox.models import AuthToken
+
+from location.models import Current_Branch
+from staff import authentication
+from staff.models import Roles
+
+
+@receiver(user_logged_out)
+def logged_out(sender, user, **kwargs):
+    if user is not None:
+        authentication.evict_user(user.id)
+
+
+@receiver(post_delete, sender=AuthToken)
+def token_deleted(sender, instance, **kwargs):
+    authentication.evict_digest(instance.digest)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    authentication.evict_user(instance.id)
+
+
+@receiver(post_save, sender=Roles)
+@receiver(post_delete, sender=Roles)
+@receiver(post_save, sender=Current_Branch)
+@receiver(post_delete, sender=Current_Branch)
+def user_relations_changed(sender, instance, **kwargs):
+    if instance.user_id:
+        authentication.evict_user(instance.user_id)
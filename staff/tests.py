@@ -0,0 +1,359 @@
+import datetime, random, unittest
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from knox.models import AuthToken
+
+from staff import authentication, payroll
+from location.models import Branches, Current_Branch
+from staff.models import Roles, Hours_In, Bimonthly_In, Government_Benefits, Loans
+from stock.models import Products, Transactions
+
+
+def reference_pay(hours_in, hrly_rate, hrly_allow, benefits, deductions):
+    # the pay rules as BimonthlyInAdmin.save_model applied them one staff
+    # at a time, over a list of (day type, hours, overtime hours)
+    def total(day_type, index):
+        return sum(h[index] for h in hours_in if h[0] == day_type)
+
+    def count(day_type):
+        return len([h for h in hours_in if h[0] == day_type])
+
+    pay = {}
+    pay_tot = 0
+    pay['hrs_reg'] = total('REG', 1)
+    pay['hrs_reg_over'] = total('REG', 2)
+    pay['pay_reg'] = pay['hrs_reg'] * hrly_rate
+    pay['pay_reg_over'] = pay['hrs_reg_over'] * hrly_rate * 1.25
+    pay_tot += pay['pay_reg']
+
+    zero_hd = len([h for h in hours_in if h[0] == 'HD' and h[1] == 0])
+    pay['hrs_hd'] = total('HD', 1)
+    pay['hrs_hd_over'] = total('HD', 2)
+    pay['pay_hd'] = pay['hrs_hd'] * hrly_rate * 2 + hrly_rate * 8 * zero_hd
+    pay['pay_hd_over'] = pay['hrs_hd_over'] * hrly_rate * 2 * 1.3
+    pay_tot += pay['pay_hd']
+
+    pay['hrs_shd'] = total('SHD', 1)
+    pay['hrs_shd_over'] = total('SHD', 2)
+    pay['pay_shd'] = pay['hrs_shd'] * hrly_rate * 1.3
+    pay['pay_shd_over'] = pay['hrs_shd_over'] * hrly_rate * 1.69
+    pay_tot += pay['pay_shd']
+
+    pay['hrs_vl'] = count('VL') * 8
+    pay['pay_vl'] = pay['hrs_vl'] * hrly_rate
+    pay_tot += pay['pay_vl']
+    pay['hrs_sl'] = count('SL') * 8
+    pay['pay_sl'] = pay['hrs_sl'] * hrly_rate
+    pay_tot += pay['pay_sl']
+    pay['hrs_spl'] = count('SPL') * 8
+    pay['pay_spl'] = pay['hrs_spl'] * hrly_rate
+    pay_tot += pay['pay_spl']
+
+    pay['extr_alw'] = hrly_allow * pay['hrs_reg']
+    pay['extr_alw'] += pay['hrs_hd'] * hrly_allow
+    pay['extr_alw'] += pay['hrs_shd'] * hrly_allow
+    pay_tot += pay['extr_alw']
+
+    for b in benefits:
+        if not b:
+            continue
+        pay_tot += b
+    for d in deductions:
+        if not d:
+            continue
+        pay_tot -= d
+
+    pay['pay_tot'] = pay_tot
+    return pay
+
+
+def random_hours(rand):
+    return [(rand.choice(payroll.DAY_TYPES + ['REG'] * 4),
+             rand.choice([0, 3.5, 4, 8, 9.25, 10.1]),
+             rand.choice([0, 0, 0.5, 1.5, 2.25]))
+            for _ in range(rand.randint(0, 16))]
+
+
+def hours_totals(hours_in):
+    hours = payroll.empty_hours()
+    for day_type, h, overtime in hours_in:
+        hours[day_type]['hours'] += h
+        hours[day_type]['overtime'] += overtime
+        hours[day_type]['days'] += 1
+        hours[day_type]['zero_days'] += h == 0
+    return hours
+
+
+class PayCalculatorParityTest(TestCase):
+
+    def test_vectorized_pay_matches_scalar_formulas(self):
+        rand = random.Random(0)
+        staff_hours, rates, allows, benefits, deductions, expected = [], [], [], [], [], []
+        for _ in range(300):
+            hours_in = random_hours(rand)
+            rate = rand.choice([37.5, 40, 45.3, 51.25, 60.1])
+            allow = rand.choice([0, 2.5, 5, 7.35])
+            bene = [rand.choice([None, 0, 150, 75.5]) for _ in range(4)]
+            ded = [rand.choice([None, 0, 20, 33.3]) for _ in range(4)]
+
+            staff_hours.append(hours_totals(hours_in))
+            rates.append(rate)
+            allows.append(allow)
+            benefits.append(bene)
+            deductions.append(ded)
+            expected.append(reference_pay(hours_in, rate, allow, bene, ded))
+
+        pays = payroll.compute_pays(staff_hours, rates, allows, benefits, deductions)
+
+        for pay, reference in zip(pays, expected):
+            self.assertEqual(pay, reference)
+
+
+class PayrollSaveParityTest(TestCase):
+
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', password='manager')
+        Roles.objects.create(user=self.manager, manager=self.manager, is_manager=True)
+
+        # a payroll date the automation accepts, and the one before it
+        today = datetime.date.today()
+        for months in [-1, 0, 1]:
+            for day in [8, 23]:
+                candidate = (today + relativedelta(months=months)).replace(day=day)
+                if today - datetime.timedelta(days=20) <= candidate <= today + datetime.timedelta(days=10):
+                    self.date = candidate
+        if self.date.day == 23:
+            self.previous = self.date.replace(day=8)
+        else:
+            self.previous = (self.date - relativedelta(months=1)).replace(day=23)
+
+        rand = random.Random(1)
+        self.staff = []
+        self.hours = {}
+        low_limit, up_limit = Hours_In.get_period(str(self.date.day), self.date)
+        for s in range(5):
+            staff = get_user_model().objects.create(username='staff-' + str(s))
+            Roles.objects.create(user=staff, manager=self.manager, is_retailer=True,
+                                 hrly_rate=40 + s * 2.5, hrly_allow=s * 1.5)
+            for institute, cont in [('SSS', 100), ('PI', 50), ('PH', 75.25)]:
+                benefit = Government_Benefits.objects.create(staff=staff, manager=self.manager,
+                                                             institute=institute, staff_cont=cont)
+                Loans.objects.create(manager=self.manager, institute=benefit, loan_type='SAL',
+                                     date_str=self.previous, date_end=self.date, total=1000,
+                                     mnth_pay=s * 10, total_paid=0, interest=0)
+
+            hours_in = random_hours(rand)
+            for d, (day_type, h, overtime) in enumerate(hours_in):
+                Hours_In.objects.create(staff=staff, manager=self.manager, day_type=day_type, hours=h,
+                                        overtime_hours=overtime, date=low_limit + datetime.timedelta(days=d))
+            self.hours[staff.id] = hours_in
+            self.staff.append(staff)
+
+    def bimonthly(self, staff, date, **kwargs):
+        return Bimonthly_In(staff=staff, manager=self.manager, date=date, day=str(date.day),
+                            bene_a=25, ded_c=12.5, **kwargs)
+
+    def test_save_matches_formulas(self):
+        for staff in self.staff:
+            obj = self.bimonthly(staff, self.date, pay_sss=True, pay_ph=True)
+            payroll.compute_bimonthly(obj, pay_loans=False)
+
+            expected = reference_pay(self.hours[staff.id], staff.roles.hrly_rate, staff.roles.hrly_allow,
+                                     [25, None, None, None], [None, None, 12.5, None])
+            loans = sum(Loans.objects.filter(institute__staff=staff).filter(institute__institute__in=['SSS', 'PH']
+                                    ).values_list('mnth_pay', flat=True))
+            expected['pay_tot'] -= 100 + 75.25 + loans
+            for column in expected:
+                self.assertAlmostEqual(getattr(obj, column), expected[column], places=9, msg=column)
+
+    def test_cycle_matches_single_save(self):
+        for staff in self.staff:
+            self.bimonthly(staff, self.previous, pay_tot=0).save()
+        created = payroll.run_cycle(Bimonthly_In.objects.filter(date=self.previous))
+        self.assertEqual(len(created), len(self.staff))
+
+        for obj in Bimonthly_In.objects.filter(date=self.date):
+            single = self.bimonthly(obj.staff, self.date, pay_sss=obj.pay_sss, pay_pi=obj.pay_pi, pay_ph=obj.pay_ph)
+            payroll.compute_bimonthly(single, pay_loans=False)
+            for column in payroll.compute_pay(payroll.empty_hours(), 0, 0, [], []):
+                self.assertAlmostEqual(getattr(obj, column), getattr(single, column), places=9, msg=column)
+
+        # the loans of a contribution paid this cycle were paid once
+        paid = Loans.objects.filter(institute__staff__in=self.staff).filter(total_paid__gt=0)
+        for loan in paid:
+            self.assertEqual(loan.total_paid, loan.mnth_pay)
+
+    def test_missing_rate_is_reported(self):
+        Roles.objects.filter(user=self.staff[2]).update(hrly_rate=None)
+        with self.assertRaisesMessage(ValidationError, str(self.staff[2])):
+            payroll.compute_bimonthly(self.bimonthly(self.staff[2], self.date), pay_loans=False)
+
+        for staff in self.staff:
+            self.bimonthly(staff, self.previous, pay_tot=0).save()
+        with self.assertRaisesMessage(ValidationError, str(self.staff[2])):
+            payroll.run_cycle(Bimonthly_In.objects.filter(date=self.previous))
+        self.assertFalse(Bimonthly_In.objects.filter(date=self.date).exists())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "query plans are checked on SQLite")
+class HoursInIndexTest(TestCase):
+
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', password='manager')
+        self.staff = []
+        for s in range(3):
+            staff = get_user_model().objects.create(username='staff-' + str(s))
+            self.staff.append(staff)
+            for d in range(60):
+                Hours_In.objects.create(staff=staff, manager=self.manager, hours=8,
+                                        date=datetime.date(2020, 1, 1) + datetime.timedelta(days=d))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def test_payroll_period_uses_staff_date_index(self):
+        hours_in = Hours_In.get_dailies(self.staff[0], '23', datetime.date(2020, 2, 23))
+        self.assertIn('hours_in_staff_date', self.query_plan(hours_in))
+
+        hours_in = Hours_In.objects.filter(staff__in=self.staff
+                                  ).filter(date__gte=datetime.date(2020, 2, 7)
+                                  ).filter(date__lte=datetime.date(2020, 2, 21))
+        self.assertIn('hours_in_staff_date', self.query_plan(payroll.grouped_hours(hours_in, 'staff', 'day_type')))
+
+    def test_recent_attendance_uses_manager_date_index(self):
+        hours_in = self.manager.staff_hours_in.filter(date__gte=datetime.date(2020, 2, 20))
+        self.assertIn('hours_in_manager_date', self.query_plan(hours_in))
+
+
+class BranchColumnQueryCountTest(TestCase):
+
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', password='manager', is_staff=True)
+        self.manager.user_permissions.set(Permission.objects.all())
+        Roles.objects.create(user=self.manager, manager=self.manager, is_manager=True)
+        self.branches = [Branches.objects.create(manager=self.manager, location=location)
+                         for location in ['Bravo', 'Alpha']]
+        self.client.force_login(self.manager)
+        self.date = datetime.date.today()
+        self.staff_count = 0
+
+    def add_staff(self, count):
+        for _ in range(count):
+            self.staff_count += 1
+            staff = get_user_model().objects.create(username='staff-' + str(self.staff_count))
+            roles = Roles.objects.create(user=staff, manager=self.manager, is_retailer=True)
+            roles.branches.set(self.branches)
+            Hours_In.objects.create(staff=staff, manager=self.manager, hours=8, date=self.date)
+            Bimonthly_In.objects.create(staff=staff, manager=self.manager, date=self.date, day='8', pay_tot=0)
+            benefit = Government_Benefits.objects.create(staff=staff, manager=self.manager, institute='SSS')
+            Loans.objects.create(manager=self.manager, institute=benefit, loan_type='SAL',
+                                 date_str=self.date, date_end=self.date, total=100, mnth_pay=10,
+                                 total_paid=0, interest=0)
+
+    def get_changelist(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def assertBranchColumnQueries(self, url):
+        self.add_staff(2)
+        few, _ = self.get_changelist(url)
+        self.add_staff(6)
+        many, response = self.get_changelist(url)
+        self.assertEqual(few, many)
+        self.assertContains(response, 'Alpha | Bravo | ')
+
+    def test_user_admin(self):
+        self.assertBranchColumnQueries('/auth/user/')
+
+    def test_role_admin(self):
+        self.assertBranchColumnQueries('/staff/roles/')
+
+    def test_hours_in_admin(self):
+        self.assertBranchColumnQueries('/staff/hours_in/')
+
+    def test_bimonthly_in_admin(self):
+        self.assertBranchColumnQueries('/staff/bimonthly_in/')
+
+    def test_government_benefits_admin(self):
+        self.assertBranchColumnQueries('/staff/government_benefits/')
+
+    def test_loans_admin(self):
+        self.assertBranchColumnQueries('/staff/loans/')
+
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        authentication.clear()
+        self.manager = get_user_model().objects.create_user(username='manager')
+        Roles.objects.create(user=self.manager, manager=self.manager, is_manager=True)
+        self.branch = Branches.objects.create(manager=self.manager, location='Alpha')
+        self.other_branch = Branches.objects.create(manager=self.manager, location='Bravo')
+        self.retailer = get_user_model().objects.create_user(username='retailer')
+        Roles.objects.create(user=self.retailer, manager=self.manager, is_retailer=True)
+        self.cur_branch = Current_Branch.objects.create(manager=self.manager, user=self.retailer, branch=self.branch)
+        _, token = AuthToken.objects.create(self.retailer)
+        self.auth = {'HTTP_AUTHORIZATION': 'Token ' + token}
+
+    def list_transactions(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/pos/api/', **self.auth)
+        return response, queries
+
+    def test_verified_token_is_cached(self):
+        response, first = self.list_transactions()
+        self.assertEqual(response.status_code, 200)
+        response, again = self.list_transactions()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in again if 'knox_authtoken' in q['sql']])
+        self.assertLess(len(again), len(first))
+
+    def test_cached_ids(self):
+        self.client.post('/pos/api/', {'retailer': self.retailer.id, 'product': self.add_product().id, 'count': 1},
+                         **self.auth)
+        self.cur_branch.branch = self.other_branch
+        self.cur_branch.save()
+        self.client.post('/pos/api/', {'retailer': self.retailer.id, 'product': self.add_product().id, 'count': 1},
+                         **self.auth)
+        self.assertEqual([(t.manager, t.branch) for t in Transactions.objects.order_by('id')],
+                         [(self.manager, self.branch), (self.manager, self.other_branch)])
+
+    def add_product(self):
+        count = Products.objects.count()
+        return Products.objects.create(manager=self.manager, name='Product ' + str(count), size='1pc', price=1,
+                                       product_id='P' + str(count), items_per_package=1)
+
+    def test_logout_evicts_token(self):
+        self.list_transactions()
+        self.assertEqual(self.client.post('/staff/api/logout/', **self.auth).status_code, 204)
+        self.assertEqual(self.list_transactions()[0].status_code, 401)
+
+    @override_settings(AUTH_TOKEN_CACHE_TTL=0)
+    def test_expired_token_is_evicted(self):
+        self.list_transactions()
+        AuthToken.objects.filter(user=self.retailer).update(expiry=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.list_transactions()[0].status_code, 401)
+        self.assertFalse(AuthToken.objects.exists())
+
+    def test_inactive_user_is_rejected(self):
+        self.list_transactions()
+        self.retailer.is_active = False
+        self.retailer.save()
+        self.assertEqual(self.list_transactions()[0].status_code, 401)
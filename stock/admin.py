@@ -1,8 +1,5 @@
-import datetime
-
 from django import forms
 from django.contrib import admin
-from django.utils import timezone
 from django.contrib.admin import DateFieldListFilter
 from django.contrib.auth import get_user_model
 from django.http import HttpResponse, FileResponse
@@ -19,6 +16,7 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 from .models import Purchases, Purchase_Payment_Method, Products, Distributor, Transactions
 from location.models import Branches
 from finance.admin import BaseExpensePurchaseSubAdmin
+from adminApiModel.scope import get_scope
 from adminApiModel.utils import FilterBranchStaffPurchaseMethodDistributorDropDown, \
                                 BranchFilter, \
                                 TotalsumAdmin
@@ -101,34 +99,8 @@ class PurchaseCustomAdmin(TotalsumAdmin, FilterBranchStaffPurchaseMethodDistribu
 
 
     def get_queryset(self, request):
-        user = request.user
-        if user.is_superuser:
-            return super().get_queryset(request)
-        elif user.roles.is_manager:
-            return super().get_queryset(request
-                   ).filter(manager=user)
-        elif user.roles.is_assistant:
-            days = user.roles.purchase_days
-            branches = user.roles.purchase_branches.all()
-            if days and branches:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=days)
-                       ).filter(branch__in=branches)
-            else:
-                raise RuntimeError("User if assistant but roles improperly configured")
-        elif user.roles.is_retailer:
-            days = user.roles.days
-            if days:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=days)
-                       ).filter(branch__in=user.roles.branches.all())
-            else:
-                return super().get_queryset(request
-                       ).filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=1)
-                       ).filter(branch__in=user.roles.branches.all())
+        return super().get_queryset(request).for_user(request.user, 'purchase')
+
         # elif user.roles.is_assistant:
         #     return super().get_queryset(request
         #            ).filter(manager=user.roles.manager)
@@ -299,13 +271,7 @@ class ProductCustomAdmin(ImportExportModelAdmin):
             super().save_model(request, obj, form, change)
 
     def get_queryset(self, request):
-        user = request.user
-        if user.is_superuser:
-            return Products.objects.all()
-        elif user.roles.is_manager:
-            return user.products
-        else:
-            return user.roles.manager.products
+        return get_scope(request).owned(Products)
 
 
     def get_resource_kwargs(self, request, *args, **kwargs):
@@ -374,34 +340,19 @@ class TransactionCustomAdmin(ImportExportModelAdmin):
 
 
     def get_queryset(self, request):
-        user = request.user
-        if user.is_superuser:
-            return Transactions.objects.all()
-        elif user.roles.is_manager:
-            return user.transactions
-        else:
-            return user.roles.manager.transactions.filter(manager=user.roles.manager
-                       ).filter(date__gte=timezone.now() - datetime.timedelta(days=1)
-                       ).filter(branch__in=user.roles.branches.all())
+        # retailers only see the transactions of the last day
+        return Transactions.objects.for_user(request.user, days=1)
 
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        scope = get_scope(request)
         if db_field.name == "branch":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Branches.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.branches.filter(is_open=True)
+            if scope.is_superuser or scope.is_manager:
+                kwargs["queryset"] = scope.open_branches()
             else:
-                kwargs["queryset"] = request.user.roles.branches.filter(is_open=True).filter(id=request.user.cur_branch.branch.id)
+                kwargs["queryset"] = scope.open_branches().filter(id=request.user.cur_branch.branch_id)
         elif db_field.name == "product":
-            if request.user.is_superuser:
-                kwargs["queryset"] = \
-                    Products.objects.all()
-            elif request.user.roles.is_manager:
-                kwargs["queryset"] = request.user.products.filter(is_active=True)
-            else:
-                kwargs["queryset"] = request.user.roles.manager.products.filter(is_active=True)
+            kwargs["queryset"] = scope.active(Products)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
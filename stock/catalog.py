@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+
+# how long a serialized catalog is cached, in seconds. Every change makes
+# a new version, so cached catalogs are never stale, only unused
+CATALOG_TIMEOUT = 60 * 60 * 24
+
+
+# The POS downloads the active products of its manager once, then asks for
+# the products changed since the version it has. Saving a product, in the
+# admin or through an import, bumps the manager's Catalog_Version and
+# stamps the product with the new version. Deleting one bumps it too, and
+# makes clients older than that download the whole catalog again.
+
+
+def bump(manager_id, deleted=False):
+    """ Increase the catalog version of the manager and return it """
+    from stock.models import Catalog_Version
+
+    versions = Catalog_Version.objects.filter(manager_id=manager_id)
+    with transaction.atomic():
+        if deleted:
+            # no get_or_create here, the manager may be being deleted as
+            # well. Without a version row the catalog was only ever served
+            # at version 0
+            if not versions.update(version=F('version') + 1, full_since=F('version') + 1):
+                cache.delete(catalog_key(manager_id, 0))
+                return 0
+        else:
+            Catalog_Version.objects.get_or_create(manager_id=manager_id)
+            versions.update(version=F('version') + 1)
+        return versions.values_list('version', flat=True).get()
+
+
+def get_version(manager_id):
+    """ (version, full_since) of the manager's catalog """
+    from stock.models import Catalog_Version
+
+    version = Catalog_Version.objects.filter(manager_id=manager_id).values_list('version', 'full_since').first()
+    return version or (0, 0)
+
+
+def etag(manager_id, version):
+    return '"catalog-' + str(manager_id) + '-' + str(version) + '"'
+
+
+def catalog_key(manager_id, version):
+    return 'catalog:' + str(manager_id) + ':' + str(version)
+
+
+def get_catalog(manager_id, version):
+    """ The serialized active products of the manager at ``version`` """
+    from stock.models import Products
+    from stock.serializers import CatalogProductSerializer
+
+    key = catalog_key(manager_id, version)
+    products = cache.get(key)
+    if products is None:
+        products = list(CatalogProductSerializer(Products.objects.filter(manager_id=manager_id
+                                                                ).filter(is_active=True
+                                                                ).order_by('id'), many=True).data)
+        cache.set(key, products, CATALOG_TIMEOUT)
+    return products
+
+
+def get_changes(manager_id, since):
+    """
+    The serialized products of the manager changed after version ``since``,
+    deactivated ones included so the POS can drop them.
+    """
+    from stock.models import Products
+    from stock.serializers import CatalogProductSerializer
+
+    return CatalogProductSerializer(Products.objects.filter(manager_id=manager_id
+                                                   ).filter(version__gt=since
+                                                   ).order_by('id'), many=True).data
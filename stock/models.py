@@ -8,6 +8,8 @@ from private_storage.fields import PrivateFileField
 
 from location.models import Branches
 from adminApiModel.validators import file_size_15
+from adminApiModel.querysets import ScopedManager
+from stock import catalog
 
 
 class Purchases(models.Model):
@@ -65,10 +67,15 @@ class Purchases(models.Model):
     invoice_file = PrivateFileField(blank=True, null=True, upload_to=invoice_user_directory_path, max_file_size=15728640)
     proof_of_payment = PrivateFileField(blank=True, null=True, upload_to=payment_user_directory_path, max_file_size=15728640)
 
+    objects = ScopedManager()
+
 
     class Meta:
         verbose_name = "Purchase"
         verbose_name_plural = "Purchases"
+        indexes = [
+            models.Index(fields=['manager', 'branch', 'date'], name='purchases_manager_branch_date'),
+        ]
 
     def __str__(self):
         return str(self.branch) + " " + str(self.date)
@@ -145,6 +152,8 @@ class Products(models.Model):
     product_id = models.CharField(max_length=128)
     items_per_package = models.IntegerField()
     cost = models.FloatField(null=True)
+    # catalog version of the manager at the last change, see stock.catalog
+    version = models.PositiveIntegerField(default=0, editable=False)
 
 
     class Meta:
@@ -162,6 +171,10 @@ class Products(models.Model):
                         'product_id',],
                 name='unique product id'),
         ]
+        indexes = [
+            # catalog changes since a version
+            models.Index(fields=['manager', 'version'], name='products_manager_version'),
+        ]
 
 
     def __str__(self):
@@ -170,6 +183,8 @@ class Products(models.Model):
     def save(self, *args, **kwargs):
         if not self.id:
             self.date_start = timezone.now().date()
+        if self.manager_id:
+            self.version = catalog.bump(self.manager_id)
         return super(Products, self).save(*args, **kwargs)
 
 
@@ -198,14 +213,134 @@ class Transactions(models.Model):
     is_valid = models.BooleanField(default=True)
     date = models.DateField(editable=False, blank=True)
     time = models.TimeField(editable=False, blank=True, null = True)
+    batch = models.ForeignKey('Transaction_Batch',
+                              related_name='transactions',
+                              on_delete=models.SET_NULL,
+                              null=True,
+                              blank=True,
+                              editable=False)
+    # the POS that saved the transaction while offline and its running
+    # number there, set by the sync API
+    device_id = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    device_seq = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    objects = ScopedManager()
+
+
+    class Meta:
+        constraints = [
+            # a transaction synced again is ignored
+            models.UniqueConstraint(
+                fields=['manager',
+                        'device_id',
+                        'device_seq'],
+                condition=Q(device_id__isnull=False),
+                name='unique device transaction'),
+        ]
+        indexes = [
+            models.Index(fields=['manager', 'branch', 'date'], name='trxn_manager_branch_date'),
+        ]
 
 
     def save(self, *args, **kwargs):
-        if not self.id:
-            self.date = timezone.now().date()
-            self.time = timezone.now().time()
+        if not self.id and self.date is None:
+            # local date and time, so the POS list of today finds it.
+            # Synced transactions keep the time they were made at
+            now = timezone.localtime()
+            self.date = now.date()
+            self.time = now.time()
         return super(Transactions, self).save(*args, **kwargs)
 
 
     def __str__(self):
         return str(self.retailer) + " " + str(self.product) + " " + str(self.count)
+
+
+
+class Transaction_Batch(models.Model):
+    """
+    A basket the POS submitted in one request. The key is generated by the
+    POS, so a basket sent again after a dropped connection is recognized
+    and its transactions are not saved twice.
+    """
+
+
+    manager = models.ForeignKey(get_user_model(),
+                               related_name='transaction_batches',
+                               on_delete=models.CASCADE)
+    retailer = models.ForeignKey(get_user_model(),
+                               related_name='retailer_transaction_batches',
+                               on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+    class Meta:
+        verbose_name = "Transaction Batch"
+        verbose_name_plural = "Transaction Batches"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['retailer',
+                        'key',],
+                name='unique transaction batch'),
+        ]
+
+
+    def __str__(self):
+        return str(self.retailer) + " " + str(self.key)
+
+
+
+class Catalog_Version(models.Model):
+    """
+    Version of a manager's product catalog, increased whenever one of the
+    products changes. Catalogs older than full_since have to be downloaded
+    again in full, since a product was deleted after them.
+    """
+
+
+    manager = models.OneToOneField(get_user_model(),
+                                   related_name='catalog_version',
+                                   on_delete=models.CASCADE)
+    version = models.PositiveIntegerField(default=0)
+    full_since = models.PositiveIntegerField(default=0)
+
+
+    class Meta:
+        verbose_name = "Catalog Version"
+        verbose_name_plural = "Catalog Versions"
+
+
+    def __str__(self):
+        return str(self.manager) + " " + str(self.version)
+
+
+
+class Sync_Device(models.Model):
+    """
+    A POS that syncs transactions made offline. Its transactions are
+    numbered from 1, and the watermark is the highest number up to which
+    every transaction has been saved.
+    """
+
+
+    manager = models.ForeignKey(get_user_model(),
+                               related_name='sync_devices',
+                               on_delete=models.CASCADE)
+    device_id = models.CharField(max_length=64)
+    watermark = models.PositiveIntegerField(default=0)
+
+
+    class Meta:
+        verbose_name = "Sync Device"
+        verbose_name_plural = "Sync Devices"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['manager',
+                        'device_id',],
+                name='unique sync device'),
+        ]
+
+
+    def __str__(self):
+        return str(self.device_id) + " " + str(self.watermark)
@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TransactionCursorPagination(CursorPagination):
+    """
+    Newest transactions first. The cursor keeps its place when new
+    transactions come in between two pages, unlike page numbers.
+
+    DRF's cursor only remembers the first ordering field, so it is ordered
+    on the id alone: the list only holds today's transactions, whose date
+    would leave the cursor a plain offset. Ids grow as transactions are
+    saved, so a transaction synced from a POS later sorts by when it came
+    in rather than by its time.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    ordering = '-id'
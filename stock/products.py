@@ -0,0 +1,44 @@
+from django.core.cache import cache
+
+
+# how long the active products of a manager are cached, in seconds. Saving
+# or deleting a product drops the cache sooner, see stock.signals
+ACTIVE_PRODUCTS_TIMEOUT = 300
+
+
+def active_products_key(manager_id):
+    return 'active_products:' + str(manager_id)
+
+
+def get_active_products(manager_id):
+    """ {id: product_id} of the manager's active products """
+    from stock.models import Products
+
+    key = active_products_key(manager_id)
+    products = cache.get(key)
+    if products is None:
+        products = dict(Products.objects.filter(manager_id=manager_id
+                                       ).filter(is_active=True
+                                       ).values_list('id', 'product_id'))
+        cache.set(key, products, ACTIVE_PRODUCTS_TIMEOUT)
+    return products
+
+
+def unknown_products(manager_id, ids, inactive=False):
+    """
+    Sorted ids out of ``ids`` that are not active products of the manager,
+    or not products of the manager at all when ``inactive`` is set.
+    """
+    from stock.models import Products
+
+    active = get_active_products(manager_id)
+    unknown = {i for i in ids if i not in active}
+    if unknown and inactive:
+        unknown -= set(Products.objects.filter(manager_id=manager_id
+                                      ).filter(id__in=unknown
+                                      ).values_list('id', flat=True))
+    return sorted(unknown)
+
+
+def invalidate_active_products(manager_id):
+    cache.delete(active_products_key(manager_id))
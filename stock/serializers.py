@@ -1,8 +1,21 @@
+import datetime
+
+from django.utils import timezone
 from rest_framework import serializers
 
 from .models import Transactions, Products
 
 
+# most lines the POS can send in one basket
+MAX_BATCH_LINES = 200
+
+# most transactions the POS can send in one sync
+MAX_SYNC_TRANSACTIONS = 1000
+
+# how far ahead of the server a POS clock may run
+MAX_CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+
 class TransactionReadSerializer(serializers.ModelSerializer):
     retailer = serializers.StringRelatedField()
     product = serializers.SlugRelatedField(slug_field='product_id', read_only=True)
@@ -10,10 +23,53 @@ class TransactionReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Transactions 
-        fields = ['retailer', 'time', 'product', 'count']
+        fields = ['id', 'retailer', 'time', 'product', 'count']
 
 
 class TransactionCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transactions 
-        fields = ['retailer', 'product', 'count']
\ No newline at end of file
+        fields = ['retailer', 'product', 'count']
+
+class TransactionLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=1)
+
+
+class TransactionBatchSerializer(serializers.Serializer):
+    key = serializers.CharField(max_length=64)
+    lines = TransactionLineSerializer(many=True, allow_empty=False)
+
+    def validate_lines(self, lines):
+        if len(lines) > MAX_BATCH_LINES:
+            raise serializers.ValidationError('A basket can have at most ' + str(MAX_BATCH_LINES) + ' lines.')
+        return lines
+
+
+class SyncedTransactionSerializer(serializers.Serializer):
+    seq = serializers.IntegerField(min_value=1)
+    product = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=1)
+    timestamp = serializers.DateTimeField()
+
+    def validate_timestamp(self, timestamp):
+        # a POS with a wrong clock would book its sales on another day
+        if timestamp > timezone.now() + MAX_CLOCK_SKEW:
+            raise serializers.ValidationError('Timestamp is in the future, check the clock of the device.')
+        return timestamp
+
+
+class TransactionSyncSerializer(serializers.Serializer):
+    device_id = serializers.CharField(max_length=64)
+    transactions = SyncedTransactionSerializer(many=True, allow_empty=False)
+
+    def validate_transactions(self, transactions):
+        if len(transactions) > MAX_SYNC_TRANSACTIONS:
+            raise serializers.ValidationError('A sync can have at most ' + str(MAX_SYNC_TRANSACTIONS) + ' transactions.')
+        return transactions
+
+
+class CatalogProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Products
+        fields = ['id', 'product_id', 'name', 'size', 'price', 'items_per_package', 'is_active', 'version']
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from stock import catalog, products
+from stock.models import Products
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def products_changed(sender, instance, **kwargs):
+    products.invalidate_active_products(instance.manager_id)
+
+
+@receiver(post_delete, sender=Products)
+def product_deleted(sender, instance, **kwargs):
+    if instance.manager_id:
+        catalog.bump(instance.manager_id, deleted=True)
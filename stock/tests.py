@@ -0,0 +1,263 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from knox.models import AuthToken
+
+from location.models import Branches, Current_Branch
+from staff.models import Roles
+from stock.models import Products, Transactions, Transaction_Batch
+
+
+class TransactionApiTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.manager = get_user_model().objects.create_user(username='manager')
+        Roles.objects.create(user=self.manager, manager=self.manager, is_manager=True)
+        self.branch = Branches.objects.create(manager=self.manager, location='Alpha')
+        self.retailer = get_user_model().objects.create_user(username='retailer')
+        Roles.objects.create(user=self.retailer, manager=self.manager, is_retailer=True)
+        Current_Branch.objects.create(manager=self.manager, user=self.retailer, branch=self.branch)
+        self.product = Products.objects.create(manager=self.manager, name='Paracetamol', size='500mg', price=5,
+                                               product_id='PCM500', items_per_package=10)
+        _, token = AuthToken.objects.create(self.retailer)
+        self.auth = {'HTTP_AUTHORIZATION': 'Token ' + token}
+
+    def add_transactions(self, count):
+        return [Transactions.objects.create(manager=self.manager, retailer=self.retailer, branch=self.branch,
+                                            product=self.product, count=1)
+                for _ in range(count)]
+
+    def list(self, url):
+        response = self.client.get(url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class TransactionApiTest(TransactionApiTestCase):
+
+    def test_pages_newest_first(self):
+        ids = [t.id for t in self.add_transactions(5)]
+        first = self.list('/pos/api/?page_size=3')
+        self.assertEqual([t['id'] for t in first['results']], ids[:1:-1])
+        second = self.list(first['next'])
+        self.assertEqual([t['id'] for t in second['results']], ids[1::-1])
+        self.assertIsNone(second['next'])
+        self.assertEqual(first['results'][0]['product'], 'PCM500')
+
+    def test_new_transactions_do_not_shift_pages(self):
+        ids = [t.id for t in self.add_transactions(5)]
+        first = self.list('/pos/api/?page_size=3')
+        self.add_transactions(2)
+        second = self.list(first['next'])
+        self.assertEqual([t['id'] for t in first['results'] + second['results']], ids[::-1])
+
+    def test_since_returns_newer_transactions(self):
+        seen = self.add_transactions(3)
+        new = self.add_transactions(2)
+        page = self.list('/pos/api/?since=' + str(seen[-1].id))
+        self.assertEqual([t['id'] for t in page['results']], [new[1].id, new[0].id])
+        self.assertEqual(self.client.get('/pos/api/?since=x', **self.auth).status_code, 400)
+
+    def test_only_todays_transactions(self):
+        old = self.add_transactions(1)[0]
+        Transactions.objects.filter(id=old.id).update(date=timezone.localdate() - datetime.timedelta(days=1))
+        today = self.add_transactions(1)[0]
+        self.assertEqual([t['id'] for t in self.list('/pos/api/')['results']], [today.id])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_transactions(2)
+        # the token is verified on the first call and cached after
+        self.list('/pos/api/')
+        with CaptureQueriesContext(connection) as few:
+            self.list('/pos/api/')
+        self.add_transactions(20)
+        with CaptureQueriesContext(connection) as many:
+            self.list('/pos/api/')
+        self.assertEqual(len(few), len(many))
+
+    def test_create(self):
+        response = self.client.post('/pos/api/', {'retailer': self.retailer.id, 'product': self.product.id,
+                                                  'count': 2}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        created = Transactions.objects.get()
+        self.assertEqual((created.branch, created.manager, created.count), (self.branch, self.manager, 2))
+
+    def test_saving_without_current_branch_is_rejected(self):
+        Current_Branch.objects.filter(user=self.retailer).delete()
+        line = {'product': self.product.id, 'count': 1}
+        created = self.client.post('/pos/api/', dict(line, retailer=self.retailer.id), **self.auth)
+        batch = self.client.post('/pos/api/batch/', {'key': 'basket-1', 'lines': [line]},
+                                 content_type='application/json', **self.auth)
+        synced = self.client.post('/pos/api/sync/', {'device_id': 'pos-1', 'transactions': [
+            dict(line, seq=1, timestamp=timezone.now().isoformat())]}, content_type='application/json', **self.auth)
+        self.assertEqual([r.status_code for r in (created, batch, synced)], [400, 400, 400])
+        self.assertFalse(Transactions.objects.exists())
+
+
+class TransactionBatchApiTest(TransactionApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = Products.objects.create(manager=self.manager, name='Ibuprofen', size='200mg', price=7,
+                                             product_id='IBU200', items_per_package=10)
+        self.basket = {'key': 'basket-1', 'lines': [
+            {'product': self.product.id, 'count': 2},
+            {'product': self.other.id, 'count': 1},
+        ]}
+
+    def post_batch(self, basket):
+        return self.client.post('/pos/api/batch/', basket, content_type='application/json', **self.auth)
+
+    def test_batch_creates_every_line(self):
+        response = self.post_batch(self.basket)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([(t['product'], t['count']) for t in response.json()], [('PCM500', 2), ('IBU200', 1)])
+        saved = Transactions.objects.order_by('id')
+        self.assertEqual([t.id for t in saved], [t['id'] for t in response.json()])
+        for t in saved:
+            self.assertEqual((t.manager, t.retailer, t.branch), (self.manager, self.retailer, self.branch))
+            self.assertEqual(t.date, timezone.localdate())
+            self.assertIsNotNone(t.time)
+
+    def test_retried_batch_is_not_saved_twice(self):
+        first = self.post_batch(self.basket)
+        retry = self.post_batch(self.basket)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Transactions.objects.count(), 2)
+        self.assertEqual(Transaction_Batch.objects.count(), 1)
+
+    def test_retried_batch_survives_deactivated_product(self):
+        first = self.post_batch(self.basket)
+        self.other.is_active = False
+        self.other.save()
+        retry = self.post_batch(self.basket)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+
+    def test_inactive_product_is_rejected(self):
+        self.post_batch({'key': 'warm-cache', 'lines': [{'product': self.product.id, 'count': 1}]})
+        self.other.is_active = False
+        self.other.save()
+        response = self.post_batch(self.basket)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transactions.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self.post_batch({'key': 'warm-cache', 'lines': [{'product': self.product.id, 'count': 1}]})
+        with CaptureQueriesContext(connection) as few:
+            self.post_batch({'key': 'few', 'lines': [{'product': self.product.id, 'count': 1}] * 2})
+        with CaptureQueriesContext(connection) as many:
+            self.post_batch({'key': 'many', 'lines': [{'product': self.product.id, 'count': 1}] * 20})
+        self.assertEqual(len(few), len(many))
+
+
+class TransactionSyncApiTest(TransactionApiTestCase):
+
+    def synced(self, seqs, hour=9):
+        made = timezone.make_aware(datetime.datetime.combine(timezone.localdate() - datetime.timedelta(days=1),
+                                                             datetime.time(hour)))
+        return [{'seq': seq, 'product': self.product.id, 'count': 1,
+                 'timestamp': (made + datetime.timedelta(minutes=seq)).isoformat()}
+                for seq in seqs]
+
+    def sync(self, transactions, device_id='pos-1'):
+        return self.client.post('/pos/api/sync/', {'device_id': device_id, 'transactions': transactions},
+                                content_type='application/json', **self.auth)
+
+    def test_sync_keeps_client_time(self):
+        response = self.sync(self.synced([1, 2]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'device_id': 'pos-1', 'received': 2, 'created': 2, 'watermark': 2})
+        saved = Transactions.objects.order_by('device_seq')
+        self.assertEqual([(t.date, t.time) for t in saved], [
+            (timezone.localdate() - datetime.timedelta(days=1), datetime.time(9, 1)),
+            (timezone.localdate() - datetime.timedelta(days=1), datetime.time(9, 2)),
+        ])
+        self.assertEqual((saved[0].branch, saved[0].retailer), (self.branch, self.retailer))
+
+    def test_resync_skips_saved_transactions(self):
+        self.sync(self.synced([1, 2, 3]))
+        response = self.sync(self.synced([2, 3, 4, 5]))
+        self.assertEqual(response.json(), {'device_id': 'pos-1', 'received': 4, 'created': 2, 'watermark': 5})
+        self.assertEqual(Transactions.objects.count(), 5)
+        # another device numbers its transactions on its own
+        self.assertEqual(self.sync(self.synced([1]), device_id='pos-2').json()['created'], 1)
+
+    def test_watermark_stops_at_first_gap(self):
+        self.sync(self.synced([1, 2]))
+        # 3 and 4 were in a batch that failed
+        self.assertEqual(self.sync(self.synced([5, 6])).json()['watermark'], 2)
+        self.assertEqual(self.sync(self.synced([3, 4])).json()['watermark'], 6)
+
+    def test_future_timestamp_is_rejected(self):
+        ahead = self.synced([1])
+        ahead[0]['timestamp'] = (timezone.now() + datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.sync(ahead).status_code, 400)
+        self.assertFalse(Transactions.objects.exists())
+
+    def test_inactive_product_is_accepted(self):
+        self.product.is_active = False
+        self.product.save()
+        self.assertEqual(self.sync(self.synced([1])).status_code, 200)
+        bad = self.synced([2])
+        bad[0]['product'] = 0
+        self.assertEqual(self.sync(bad).status_code, 400)
+
+    def test_saved_transactions_are_still_stamped(self):
+        created = self.add_transactions(1)[0]
+        self.assertEqual(created.date, timezone.localdate())
+        self.assertIsNone(created.device_id)
+
+
+class CatalogApiTest(TransactionApiTestCase):
+
+    def get_catalog(self, url='/pos/catalog/', **headers):
+        return self.client.get(url, **self.auth, **headers)
+
+    def test_catalog_is_cached_per_version(self):
+        first = self.get_catalog()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual([p['product_id'] for p in first.json()['products']], ['PCM500'])
+        self.assertTrue(first.json()['full'])
+        with CaptureQueriesContext(connection) as queries:
+            again = self.get_catalog()
+        self.assertEqual(again.json(), first.json())
+        self.assertFalse([q for q in queries if 'stock_products' in q['sql']])
+
+    def test_unchanged_catalog_is_not_modified(self):
+        etag = self.get_catalog()['ETag']
+        self.assertEqual(self.get_catalog(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.product.price = 6
+        self.product.save()
+        changed = self.get_catalog(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.json()['products'][0]['price'], 6)
+
+    def test_changes_since_version(self):
+        version = self.get_catalog().json()['version']
+        added = Products.objects.create(manager=self.manager, name='Ibuprofen', size='200mg', price=7,
+                                        product_id='IBU200', items_per_package=10)
+        self.product.is_active = False
+        self.product.save()
+        changes = self.get_catalog('/pos/catalog/?since=' + str(version)).json()
+        self.assertFalse(changes['full'])
+        self.assertEqual([(p['product_id'], p['is_active']) for p in changes['products']],
+                         [('PCM500', False), ('IBU200', True)])
+        self.assertEqual([p['id'] for p in self.get_catalog().json()['products']], [added.id])
+
+    def test_deletion_needs_full_catalog(self):
+        version = self.get_catalog().json()['version']
+        Products.objects.create(manager=self.manager, name='Ibuprofen', size='200mg', price=7,
+                                product_id='IBU200', items_per_package=10).delete()
+        catalog = self.get_catalog('/pos/catalog/?since=' + str(version)).json()
+        self.assertTrue(catalog['full'])
+        self.assertEqual([p['product_id'] for p in catalog['products']], ['PCM500'])
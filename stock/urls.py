@@ -1,7 +1,10 @@
+from django.urls import path
 from rest_framework import routers
-from .views import TransactionViewSet
+from .views import TransactionViewSet, CatalogView
 
 router = routers.DefaultRouter()
 router.register('api', TransactionViewSet, 'transaction')
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = router.urls + [
+    path('catalog/', CatalogView.as_view(), name='catalog'),
+]
@@ -1,11 +1,22 @@
+from django.db import transaction
 from django.utils import timezone
+from django.utils.http import parse_etags
 
-from rest_framework import permissions, mixins, viewsets
+from rest_framework import permissions, mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import Transactions, Products
+from stock import catalog
+
+from .models import Transactions, Transaction_Batch, Sync_Device
+from .pagination import TransactionCursorPagination
+from .products import unknown_products
 from .serializers import TransactionReadSerializer, \
-                         TransactionCreateSerializer
+                         TransactionCreateSerializer, \
+                         TransactionBatchSerializer, \
+                         TransactionSyncSerializer
 
 
 class TransactionViewSet(mixins.ListModelMixin,
@@ -17,14 +28,36 @@ class TransactionViewSet(mixins.ListModelMixin,
         permissions.IsAuthenticated,
     ]
     serializer_class = TransactionReadSerializer
+    pagination_class = TransactionCursorPagination
+    # request.auth holds the manager and current branch of the user, see
+    # staff.authentication
 
 
     def get_queryset(self):
         # branch filter
-        return Transactions.objects.filter(date=timezone.now()
-                                    ).filter(is_valid=True
-                                    ).filter(manager=self.request.user.roles.manager
-                                    ).order_by('-time')
+        queryset = Transactions.objects.filter(date=timezone.localdate()
+                                      ).filter(is_valid=True
+                                      ).filter(manager_id=self.request.auth.manager_id
+                                      ).select_related('retailer', 'product')
+
+        # ?since=<id> polls for the transactions after the newest one the
+        # client already has
+        since = self.request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({'since': 'Must be a transaction id.'})
+            queryset = queryset.filter(id__gt=since)
+        return queryset
+
+
+    def get_branch_id(self):
+        # a retailer without a current branch cannot say where it sold
+        branch_id = self.request.auth.branch_id
+        if branch_id is None:
+            raise ValidationError({'branch': 'Choose your current branch before saving transactions.'})
+        return branch_id
 
 
     def create(self, request, *args, **kwargs):
@@ -36,4 +69,136 @@ class TransactionViewSet(mixins.ListModelMixin,
 
 
     def perform_create(self, serializer):
-        return serializer.save(manager=self.request.user.roles.manager, branch=self.request.user.cur_branch)
\ No newline at end of file
+        return serializer.save(manager_id=self.request.auth.manager_id, branch_id=self.get_branch_id())
+
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Save a whole basket at once. Sending a basket again with the same
+        key returns the transactions saved the first time.
+        """
+        branch_id = self.get_branch_id()
+        serializer = TransactionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        key = serializer.validated_data['key']
+        lines = serializer.validated_data['lines']
+
+        manager_id = request.auth.manager_id
+        # a basket sent again is answered from what was saved, even when
+        # its products were deactivated since
+        batch = Transaction_Batch.objects.filter(retailer=request.user, key=key).first()
+        created = False
+        if batch is None:
+            unknown = unknown_products(manager_id, {line['product'] for line in lines})
+            if unknown:
+                raise ValidationError({'lines': 'Unknown or inactive products: ' + ', '.join(map(str, unknown))})
+
+            with transaction.atomic():
+                batch, created = Transaction_Batch.objects.get_or_create(retailer=request.user, key=key,
+                                                                         defaults={'manager_id': manager_id})
+                if created:
+                    # bulk_create skips Transactions.save, which stamps these
+                    now = timezone.localtime()
+                    Transactions.objects.bulk_create([
+                        Transactions(manager_id=manager_id, retailer=request.user, branch_id=branch_id,
+                                     product_id=line['product'], count=line['count'],
+                                     date=now.date(), time=now.time(), batch=batch)
+                        for line in lines
+                    ])
+
+        # read back, since not every database returns the ids of bulk inserts
+        saved = batch.transactions.select_related('retailer', 'product').order_by('id')
+        return Response(TransactionReadSerializer(saved, many=True).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """
+        Save the transactions a POS made while offline, at the time it made
+        them. Every transaction carries its running number on the device,
+        so the ones already synced are skipped. Returns the highest number
+        saved for the device without a gap, up to which the POS can drop
+        its queue.
+        """
+        branch_id = self.get_branch_id()
+        serializer = TransactionSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        device_id = serializer.validated_data['device_id']
+        synced = serializer.validated_data['transactions']
+
+        manager_id = request.auth.manager_id
+        # a product may have been deactivated since the sale was made
+        unknown = unknown_products(manager_id, {t['product'] for t in synced}, inactive=True)
+        if unknown:
+            raise ValidationError({'transactions': 'Unknown products: ' + ', '.join(map(str, unknown))})
+
+        device_transactions = Transactions.objects.filter(manager_id=manager_id).filter(device_id=device_id)
+        with transaction.atomic():
+            # locked, so two syncs of a device advance its watermark in turn
+            device, _ = Sync_Device.objects.get_or_create(manager_id=manager_id, device_id=device_id)
+            device = Sync_Device.objects.select_for_update().get(id=device.id)
+            before = device_transactions.count()
+            entries = []
+            for t in synced:
+                made = timezone.localtime(t['timestamp'])
+                entries.append(Transactions(manager_id=manager_id, retailer=request.user, branch_id=branch_id,
+                                            product_id=t['product'], count=t['count'],
+                                            date=made.date(), time=made.time(),
+                                            device_id=device_id, device_seq=t['seq']))
+            Transactions.objects.bulk_create(entries, ignore_conflicts=True)
+            created = device_transactions.count() - before
+
+            # a batch that failed leaves a gap the POS still has to send,
+            # so the watermark stops before it
+            for seq in device_transactions.filter(device_seq__gt=device.watermark
+                                         ).order_by('device_seq'
+                                         ).values_list('device_seq', flat=True):
+                if seq != device.watermark + 1:
+                    break
+                device.watermark = seq
+            device.save()
+
+        return Response({
+            'device_id': device_id,
+            'received': len(synced),
+            'created': created,
+            'watermark': device.watermark,
+        })
+
+
+
+class CatalogView(APIView):
+    """
+    The active products of the manager. With ?since=<version> only the
+    products changed after that version are sent, inactive ones included.
+    A POS whose If-None-Match holds the current ETag gets a 304.
+    """
+
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+
+    def get(self, request):
+        manager_id = request.auth.manager_id
+        version, full_since = catalog.get_version(manager_id)
+        etag = catalog.etag(manager_id, version)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({'since': 'Must be a catalog version.'})
+
+        # a version from before a deletion, or not made here, needs the
+        # whole catalog
+        if since is not None and full_since <= since <= version:
+            data = {'version': version, 'full': False, 'products': catalog.get_changes(manager_id, since)}
+        else:
+            data = {'version': version, 'full': True, 'products': catalog.get_catalog(manager_id, version)}
+        return Response(data, headers={'ETag': etag})